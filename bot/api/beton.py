@@ -1,55 +1,200 @@
 from config import settings
+from logs import addLog
+from caching import TTLCache
 
 import json
-import requests
+import random
+import asyncio
+import aiohttp
+
+
+# Responses worth retrying, the idempotent requests are retried on them and on the connection errors
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'DELETE')
+
+
+class BetonAPIError(Exception):
+    """Unsuccessful Beton API request: an error response (`code`) or a connection error (`code` is `None`)."""
+
+    def __init__(self, code: int | None, message: str, details=None) -> None:
+        super().__init__(f'[{code}] {message}' if code else message)
+        self.code = code
+        self.message = message
+        self.details = details
+
+
+def getRetryDelay(attempt: int, base_delay: float, max_delay: float) -> float:
+    "Exponential backoff with full jitter, so the retries of concurrent requests don't come together."
+
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def makeAPIError(code: int, text: str) -> BetonAPIError:
+    "Makes the error of the Beton API error response (`{'errors': [...]}` or a single response data)."
+
+    try:
+        response_data = json.loads(text)
+        error = response_data['errors'][0] if 'errors' in response_data else response_data
+        return BetonAPIError(code, error.get('message', text), error.get('details'))
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return BetonAPIError(code, text[:200])
 
 
 class BetonAPI:
-    def __init__(self) -> None:
+    """
+    asyncio client of Beton API.
+
+    One instance is created on the bot startup and shared by all the handlers,
+    so the requests reuse the keep-alive connections of its session.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5,
+        read_timeout: float = 15,
+        max_retries: int = 2,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 5,
+        cache_ttl: float = 120,
+        cache_max_size: int = 1000,
+        session: aiohttp.ClientSession = None
+    ) -> None:
         self.url = settings.BETON_API_URL
         self.auth_token = settings.BETON_API_AUTH_TOKEN
+        self.timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.session = session
+        self.own_session = session is None
+
+        # Orders pages by `('orders', status, cursor)` and orders by `('order', id)`,
+        # invalidated by the order change feed (see `watchOrderChanges`)
+        self.cache = TTLCache(max_size=cache_max_size, ttl=cache_ttl)
+        self.changes_version = None
+
+    async def __aenter__(self) -> 'BetonAPI':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def getSession(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=30),
+                headers={'Authorization': f'Bearer {self.auth_token}'}
+            )
+            self.own_session = True
+        return self.session
 
-    def sendRequest(self, method: str, url: str, data: dict = {}, headers: dict = {}) -> dict:
+    async def close(self) -> None:
+        if self.own_session and self.session and not self.session.closed:
+            await self.session.close()
+
+    async def sendRequest(self, method: str, endpoint: str, params: dict = None, data: dict = None) -> dict:
         """
-        Sends request to Beton API.
+        Sends request to Beton API and returns the response data.
+
+        The idempotent requests are retried after the connection errors and `RETRY_STATUS_CODES` responses,
+        a 429 response asking to wait longer than `retry_max_delay` isn't retried.
+        Raises `BetonAPIError` on an error response or when the retries are exhausted.
 
-        :param request_method: http request method (`get`, `post`, `patch`, `delete`).
-        :param api_method: the required method in Beton API.
+        :param method: http request method (`get`, `post`, `patch`, `delete`).
+        :param endpoint: the required endpoint of Beton API, relative to `BETON_API_URL`.
         """
 
-        args = (url, data)
-        kwargs = {'headers': headers}
-        match method.upper():
-            case 'GET': r = requests.get(*args, **kwargs)
-            case 'POST': r = requests.post(*args, **kwargs)
-            case 'PATCH': r = requests.patch(*args, **kwargs)
-            case 'DELETE': r = requests.delete(*args, **kwargs)
-
-        response = {
-            'code': r.status_code,
-            'text': r.text,
-        }
-        
-        return response
-
-    def getOrder(self, order_id: str) -> dict:
-        endpoint_url = self.url + f'store/orders/{order_id}/'
-
-        response = self.sendRequest('get', endpoint_url)
-        response_data = json.loads(response['text'])
-        
-        order = response_data['details']['order']
+        method = method.upper()
+        url = self.url + endpoint
+        session = self.getSession()
+        max_retries = self.max_retries if method in IDEMPOTENT_METHODS else 0
+
+        for attempt in range(max_retries + 1):
+            retry_after = None
+            try:
+                async with session.request(method, url, params=params, json=data) as r:
+                    status_code = r.status
+                    text = await r.text()
+                    if status_code == 429:
+                        retry_after = r.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == max_retries:
+                    raise BetonAPIError(None, f'Beton API is unavailable: {e!r}') from e
+            else:
+                if status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                    break
+
+            delay = getRetryDelay(attempt, self.retry_base_delay, self.retry_max_delay)
+            if retry_after and retry_after.isdigit():
+                # A longer wait than `retry_max_delay` is left to the caller
+                if int(retry_after) > self.retry_max_delay:
+                    break
+                delay = max(delay, int(retry_after))
+            await asyncio.sleep(delay)
+
+        if status_code >= 400:
+            raise makeAPIError(status_code, text)
+
+        return json.loads(text) if text else {}
+
+    async def getOrder(self, order_id: str) -> dict:
+        order = self.cache.get(('order', order_id))
+        if order is None:
+            response_data = await self.sendRequest('get', f'store/orders/{order_id}/')
+            order = response_data['details']['order']
+            self.cache.set(('order', order_id), order)
         return order
 
-    def getOrdersList(self, status: str = None) -> list:
-        endpoint_url = self.url + 'store/orders/'
+    async def getOrdersSummary(self, status: str = None, cursor: str = None, limit: int = 5) -> dict:
+        """
+        Returns one page of the orders summaries (`id`, `fullname`, `created_at`),
+        their total count and the cursor of the next page.
+        """
 
-        data = {}
+        cache_key = ('orders', status, cursor, limit)
+        orders_summary = self.cache.get(cache_key)
+        if orders_summary is not None:
+            return orders_summary
+
+        params = {'limit': limit, 'count': 'exact'}
         if status:
-            data['status'] = status
+            params['status'] = status
+        if cursor:
+            params['cursor'] = cursor
+
+        response_data = await self.sendRequest('get', 'store/orders/summary/', params=params)
+        orders_summary = response_data['details']
+        self.cache.set(cache_key, orders_summary)
+        return orders_summary
+
+    async def applyOrderChanges(self) -> None:
+        "Drops the cached orders changed since the previous call, any change drops the cached orders pages."
+
+        params = {} if self.changes_version is None else {'since': self.changes_version}
+        response_data = await self.sendRequest('get', 'store/orders/changes/', params=params)
+        changes = response_data['details']
+
+        if changes['reset']:
+            self.cache.clear()
+        elif changes['orders']:
+            for order_id in changes['orders']:
+                self.cache.delete(('order', order_id))
+            self.cache.deleteMatching(lambda key: key[0] == 'orders')
+        self.changes_version = changes['version']
+
+    async def watchOrderChanges(self, interval: float = 5) -> None:
+        """
+        Polls the order change feed until cancelled.
+        While the feed is unavailable the cache is cleared, so the entries can't outlive a missed change.
+        """
 
-        response = self.sendRequest('get', endpoint_url, data)
-        response_data = json.loads(response['text'])
-        
-        orders = response_data['details']['orders']
-        return orders
+        while True:
+            try:
+                await self.applyOrderChanges()
+            except Exception as e:
+                # Any failure (an error response, a changed response format) leaves the cache unverified
+                addLog(level='warning', text=f'Order changes polling failed: {e!r}')
+                self.cache.clear()
+                self.changes_version = None
+            await asyncio.sleep(interval)
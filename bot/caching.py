@@ -0,0 +1,44 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class TTLCache:
+    """
+    In-process cache with the entries expiring after `ttl` seconds.
+    The least recently used entries are dropped beyond `max_size`.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 120) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key: Any) -> Any | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any) -> None:
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: Any) -> None:
+        self.entries.pop(key, None)
+
+    def deleteMatching(self, predicate: Callable[[Any], bool]) -> None:
+        for key in [key for key in self.entries if predicate(key)]:
+            del self.entries[key]
+
+    def clear(self) -> None:
+        self.entries.clear()
@@ -1,6 +1,4 @@
-from config import settings
 from logs import addLog
-from api.telegram import TelegramAPI
 
 import traceback
 import functools
@@ -35,15 +33,7 @@ def exceptions_catcher():
                         "*🙏 Приносим извинения за предоставленные неудобства.*"
                     )
 
-                    telegram_api = TelegramAPI(settings.TELEGRAM_BOT_TOKEN)
-                    telegram_api.sendRequest(
-                        request_method='POST',
-                        api_method='sendMessage',
-                        parameters={
-                            'chat_id': user_id,
-                            'text': message_text,
-                            'parse_mode': 'Markdown',
-                        },
-                    )
+                    # The message is sent by the bot of the event, reusing its session
+                    await event.bot.send_message(user_id, message_text, parse_mode='Markdown')
         return wrapper
     return container
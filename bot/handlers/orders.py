@@ -3,23 +3,27 @@ sys.path.append('../') # src/
 
 from exceptions import exceptions_catcher
 from utils import respondEvent, datetimeToString, formatPrice
-from api.beton import BetonAPI
-from pagination import Paginator
+from api.beton import BetonAPI, BetonAPIError
+from pagination import Paginator, PageCursors
 
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+import math
 import dateutil
 from decimal import Decimal
 
 
 router = Router(name=__name__)
 
+ORDERS_PAGE_SIZE = 5
+orders_page_cursors = PageCursors()
+
 
 @router.callback_query(F.data.startswith('orders'))
 @exceptions_catcher()
-async def orders(event: CallbackQuery) -> None:
+async def orders(event: CallbackQuery, beton_api: BetonAPI) -> None:
     orders_status = None
     if '-' in event.data:
         event_data_elements = event.data.split('-')
@@ -46,9 +50,25 @@ async def orders(event: CallbackQuery) -> None:
         }
         status_title = status_titles[orders_status]
 
-        beton_api = BetonAPI()
-        orders = beton_api.getOrdersList(status=orders_status)
-        orders_count = len(orders)
+        try:
+            page = int(event_data_elements[2])
+        except IndexError:
+            page = 1
+
+        # The cursors are lost on the bot restart, then the list starts over
+        list_key = f'{event.from_user.id}:{orders_status}'
+        if not orders_page_cursors.has(list_key, page):
+            page = 1
+
+        orders_summary = await beton_api.getOrdersSummary(
+            status=orders_status, 
+            cursor=orders_page_cursors.get(list_key, page), 
+            limit=ORDERS_PAGE_SIZE
+        )
+        orders = orders_summary['orders']
+        orders_count = orders_summary['orders_count']
+        if orders_summary['next_cursor']:
+            orders_page_cursors.set(list_key, page + 1, orders_summary['next_cursor'])
 
         if not orders:
             keyboard = InlineKeyboardBuilder()
@@ -70,17 +90,14 @@ async def orders(event: CallbackQuery) -> None:
                 {'text': f'{fullname} | {created_at}', 'callback_data': f'order_card-{order_id}'}
             )
 
-        try:
-            page = int(event_data_elements[2])
-        except IndexError:
-            page = 1
         paginator = Paginator(
-            array=orders_cards, 
-            offset=5, 
+            items=orders_cards, 
+            page=page,
+            pages_count=math.ceil(orders_count / ORDERS_PAGE_SIZE),
             page_callback=f'orders-{orders_status}', 
             back_callback='orders'
         )
-        keyboard = paginator.getPageKeyboard(page)
+        keyboard = paginator.getPageKeyboard()
 
         message_text = (
             '*🛒 Список заказов*\n\n'
@@ -97,11 +114,21 @@ async def orders(event: CallbackQuery) -> None:
 
 @router.callback_query(F.data.startswith('order_card'))
 @exceptions_catcher()
-async def order_card(event: CallbackQuery) -> None:
+async def order_card(event: CallbackQuery, beton_api: BetonAPI) -> None:
     order_id = '-'.join(event.data.split('-')[1:])
 
-    beton_api = BetonAPI()
-    order = beton_api.getOrder(order_id)
+    try:
+        order = await beton_api.getOrder(order_id)
+    except BetonAPIError as e:
+        if e.code != 404:
+            raise
+        keyboard = InlineKeyboardBuilder()
+        keyboard.button(text='⬅️ Назад', callback_data='orders')
+        return await respondEvent(
+            event, 
+            text='📂 Заказ не найден',
+            reply_markup=keyboard.as_markup()
+        )
 
     fullname = order['fullname']
     contact = order['contact']
@@ -1,35 +1,156 @@
 import os
+import queue
+import atexit
 import datetime
 import logging
+import threading
+from logging.handlers import QueueHandler
 
 
 # Create a custom formatter
 time_format = "%Y-%m-%d %H:%M:%S"
 formatter = logging.Formatter(fmt='%(asctime)s [%(levelname)s] - %(message)s', datefmt=time_format)
 
-# Create a logger and set the custom formatter
+# Create a logger, its records are handled by the background log writer
 logger = logging.getLogger('custom_logger')
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+
 handler = logging.StreamHandler()
 handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+
+class HourlyLogFile:
+    """Buffered writer of `logs/<year>/<month>/<day>/log-<hour>.log` files, switching the file once per hour."""
+
+    def __init__(self, directory: str = 'logs') -> None:
+        self.directory = directory
+        self.file = None
+        self.file_hour = None
+
+    def getFile(self, now: datetime.datetime):
+        file_hour = (now.year, now.month, now.day, now.hour)
+        if file_hour != self.file_hour:
+            self.close()
+            path = f"{self.directory}/{now.year}/{now.month}/{now.day}/"
+            os.makedirs(path, exist_ok=True)
+            self.file = open(path + f"log-{now.hour}.log", 'a', encoding='utf-8', buffering=64 * 1024)
+            self.file_hour = file_hour
+        return self.file
+
+    def write(self, now: datetime.datetime, text: str) -> None:
+        self.getFile(now).write(text)
+
+    def flush(self) -> None:
+        if self.file:
+            self.file.flush()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.file_hour = None
+
+
+class LogWriter(threading.Thread):
+    """Background writer of the log records put to the queue by `QueueHandler`, records are written in batches."""
+
+    max_batch_size = 500
+
+    def __init__(self, records: queue.Queue) -> None:
+        super().__init__(name='log-writer', daemon=True)
+        self.records = records
+        self.log_file = HourlyLogFile()
+
+    def stop(self) -> None:
+        self.records.put(None)
+        self.join(timeout=5)
+
+    def run(self) -> None:
+        running = True
+        while running:
+            batch = [self.records.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+
+            for record in batch:
+                if record is None:
+                    running = False
+                    continue
+                try:
+                    self.handleRecord(record)
+                except Exception:
+                    pass
+
+            try:
+                self.log_file.flush()
+            except OSError:
+                pass
+
+        self.log_file.close()
+
+    def handleRecord(self, record: logging.LogRecord) -> None:
+        handler.handle(record)
+
+        now = datetime.datetime.fromtimestamp(record.created)
+        separator_string = f"\n\n{'='*50}\n\n"
+        self.log_file.write(now, f"{now} [{record.levelname}] - {record.getMessage()}" + separator_string)
+
+
+log_pipeline = {'writer': None, 'queue_handler': None, 'pid': None}
+log_pipeline_lock = threading.Lock()
+
+
+def startLogPipeline() -> None:
+    "Starts the log writer of the current process."
+
+    if log_pipeline['pid'] == os.getpid():
+        return
+
+    with log_pipeline_lock:
+        if log_pipeline['pid'] == os.getpid():
+            return
+
+        records = queue.Queue()
+        queue_handler = QueueHandler(records)
+        if log_pipeline['queue_handler']:
+            logger.removeHandler(log_pipeline['queue_handler'])
+        logger.addHandler(queue_handler)
+
+        writer = LogWriter(records)
+        writer.start()
+        log_pipeline.update({'writer': writer, 'queue_handler': queue_handler, 'pid': os.getpid()})
+
+
+def stopLogPipeline() -> None:
+    "Writes out the queued records before the process exits."
+
+    if log_pipeline['pid'] == os.getpid():
+        log_pipeline['writer'].stop()
+
+
+atexit.register(stopLogPipeline)
+
+
+def getLogLevel(level: str) -> int:
+    "Returns the logging level of the name, an unknown name is logged as a warning instead of failing."
+
+    level = logging.getLevelName(str(level).upper())
+    return level if isinstance(level, int) else logging.WARNING
 
 
 def addLog(level: str, text: str) -> None:
     """
-    Adds new log to file, console and telegram chat.
+    Adds new log to file and console.
+
+    The record is only put to the queue, the event loop isn't blocked by the file writes.
 
     :param level: log level (`info`, 'debug', 'warning', 'error', 'critical').
     :param text: log text.
     """
-    
-    now = datetime.datetime.now()
-    path = f"logs/{now.year}/{now.month}/{now.day}/"
-    filename = path + f"log-{now.hour}.log"
 
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(filename, 'a') as file:
-        separator_string = f"\n\n{'='*50}\n\n"
-        try:
-            file.write(f"{now} [{level.upper()}] - {text}" + separator_string)
-        except:
-            file.write(f"{now} [{level.upper()}] - {text.encode('utf-8')}" + separator_string)
+    startLogPipeline()
+    logger.log(getLogLevel(level), text)
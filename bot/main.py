@@ -2,6 +2,7 @@ from aiogram import Bot, Dispatcher
 
 from config import settings
 from handlers import common, orders
+from api.beton import BetonAPI
 
 import asyncio
 
@@ -14,7 +15,14 @@ async def main() -> None:
     dp.include_router(common.router)
     dp.include_router(orders.router)
 
-    await dp.start_polling(bot)
+    # The API client is shared by the handlers, its session keeps the connections alive between the requests
+    async with BetonAPI() as beton_api:
+        dp['beton_api'] = beton_api
+        order_changes_watcher = asyncio.create_task(beton_api.watchOrderChanges())
+        try:
+            await dp.start_polling(bot)
+        finally:
+            order_changes_watcher.cancel()
 
 
 if __name__ == '__main__':
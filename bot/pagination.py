@@ -1,52 +1,80 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-import math
+from collections import OrderedDict
+
+
+class PageCursors:
+    """
+    API cursors of the pages browsed by the users, kept in memory.
+
+    A page button carries only the page number, because the cursors don't fit
+    into the 64 bytes of the callback data. The least recently browsed lists are dropped beyond `max_lists`.
+    """
+
+    def __init__(self, max_lists: int = 1000) -> None:
+        self.max_lists = max_lists
+        self.lists = OrderedDict()
+
+    def get(self, list_key: str, page: int) -> str | None:
+        "Returns the cursor of the page, `None` for the first page or an unknown one."
+
+        if list_key not in self.lists:
+            return None
+        self.lists.move_to_end(list_key)
+        return self.lists[list_key].get(page)
+
+    def set(self, list_key: str, page: int, cursor: str) -> None:
+        self.lists.setdefault(list_key, {})[page] = cursor
+        self.lists.move_to_end(list_key)
+        while len(self.lists) > self.max_lists:
+            self.lists.popitem(last=False)
+
+    def has(self, list_key: str, page: int) -> bool:
+        return page == 1 or self.get(list_key, page) is not None
 
 
 class Paginator:
-    def __init__(self, array: list|tuple, offset: int, page_callback: str, back_callback: str = None) -> None:
-        self.array = array
-        self.offset = offset
-        self.pages_count = math.ceil(len(array) / offset)
+    """Keyboard of one page of a list paginated by the API, the items of other pages are not loaded."""
+
+    def __init__(
+        self,
+        items: list|tuple,
+        page: int,
+        pages_count: int,
+        page_callback: str,
+        back_callback: str = None
+    ) -> None:
+        self.items = items
+        self.page = page
+        self.pages_count = max(pages_count, page)
         self.page_callback = page_callback
         self.back_callback = back_callback
 
-    def getPageKeyboard(self, page: int) -> InlineKeyboardBuilder:
-        "Creates a pagination keyboard for the required page."
-
-        if page > self.pages_count:
-            return ValueError(
-                f'Page number value cannot be higher than pages count [page: {page} / {self.pages_count}].'
-            )
+    def getPageKeyboard(self) -> InlineKeyboardBuilder:
+        "Creates a pagination keyboard for the page."
 
-        start_index =  self.offset * (page - 1)
-        end_index = start_index + self.offset
-        array_items = self.array[start_index:end_index]
-        array_items_count = len(array_items)
-        
         keyboard = InlineKeyboardBuilder()
 
-        if array_items_count > 0:
-            for item in array_items:
+        if self.items:
+            for item in self.items:
                 keyboard.button(text=item['text'], callback_data=item['callback_data'])
 
             if self.pages_count > 1:
-                if page != 1:
-                    keyboard.button(text='⬅️', callback_data=f'{self.page_callback}-{page-1}')
+                if self.page != 1:
+                    keyboard.button(text='⬅️', callback_data=f'{self.page_callback}-{self.page-1}')
                 else:
                     keyboard.button(text='🚩', callback_data='#')
 
-                keyboard.button(text=f'{page} / {self.pages_count}', callback_data='#')
+                keyboard.button(text=f'{self.page} / {self.pages_count}', callback_data='#')
 
-                if page != self.pages_count:
-                    keyboard.button(text='➡️', callback_data=f'{self.page_callback}-{page+1}')
+                if self.page != self.pages_count:
+                    keyboard.button(text='➡️', callback_data=f'{self.page_callback}-{self.page+1}')
                 else:
                     keyboard.button(text='🏁', callback_data='#')
 
             if self.back_callback:
                 keyboard.button(text='⬅️ Назад', callback_data=self.back_callback)
 
-            items_rows = '1,' * array_items_count
-            exec(f"keyboard.adjust({items_rows} 3, 1)")
+            keyboard.adjust(*[1] * len(self.items), 3, 1)
 
         return keyboard
@@ -1,30 +1,265 @@
+import os
+import json
+import time
+import asyncio
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+except ImportError:  # The asyncio front-end is optional
+    aiohttp = None
+
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+
+# Telegram allows about 30 messages per second overall and 1 message per second to one chat
+GLOBAL_SEND_INTERVAL = 1 / 30
+CHAT_SEND_INTERVAL = 1
+
+SEND_METHODS = ('sendMessage', 'sendPhoto', 'sendDocument', 'sendMediaGroup', 'copyMessage', 'forwardMessage')
+
+
+class SendRateLimiter:
+    """Spaces out the messages of one bot to respect the global and per-chat send limits."""
+
+    def __init__(self, global_interval: float = GLOBAL_SEND_INTERVAL, chat_interval: float = CHAT_SEND_INTERVAL) -> None:
+        self.global_interval = global_interval
+        self.chat_interval = chat_interval
+        self.next_global_send_at = 0
+        self.next_chat_send_at = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, chat_id: int | str | None) -> float:
+        "Reserves a send slot and returns the number of seconds to wait for it."
+
+        with self.lock:
+            now = time.monotonic()
+            send_at = max(now, self.next_global_send_at, self.next_chat_send_at.get(chat_id, 0))
+            self.next_global_send_at = send_at + self.global_interval
+            if chat_id is not None:
+                self.next_chat_send_at[chat_id] = send_at + self.chat_interval
+
+            if len(self.next_chat_send_at) > 1000:
+                self.next_chat_send_at = {
+                    chat_id: chat_send_at
+                    for chat_id, chat_send_at in self.next_chat_send_at.items()
+                    if chat_send_at > now
+                }
+
+            return send_at - now
+
+
+send_rate_limiters = {}
+send_rate_limiters_lock = threading.Lock()
+
+
+def getSendRateLimiter(bot_token: str) -> SendRateLimiter:
+    with send_rate_limiters_lock:
+        if bot_token not in send_rate_limiters:
+            send_rate_limiters[bot_token] = SendRateLimiter()
+        return send_rate_limiters[bot_token]
+
+
+def getRetryAfter(response_text: str) -> float:
+    "Extracts `retry_after` seconds from the Telegram 429 response."
+
+    try:
+        return json.loads(response_text)['parameters']['retry_after']
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+http_session = {'session': None, 'pid': None}
+http_session_lock = threading.Lock()
+
+
+def getHTTPSession() -> requests.Session:
+    "Returns the keep-alive session of the current process, shared by all the clients."
+
+    with http_session_lock:
+        if http_session['pid'] != os.getpid():
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+            http_session.update({'session': session, 'pid': os.getpid()})
+        return http_session['session']
 
 
 class TelegramAPI:
-    def __init__(self, bot_token: str) -> None:
+    def __init__(
+        self,
+        bot_token: str,
+        connect_timeout: float = 5,
+        read_timeout: float = 15,
+        max_retries: int = 3,
+        max_retry_after: float = 5
+    ) -> None:
         self.bot_token = bot_token
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.send_rate_limiter = getSendRateLimiter(bot_token)
 
     def sendRequest(self, request_method: str, api_method: str, parameters: dict = {}) -> dict:
-        """Sends request to Telegram API.
+        """
+        Sends request to Telegram API.
 
-        :param request_method: http request method (`get` or `post`).
+        Messages are spaced out by the send limits, 429 responses are retried after `retry_after`.
+        A 429 response with `retry_after` beyond `max_retry_after` is returned at once,
+        so the caller isn't blocked and can reschedule the request.
+
+        :param request_method: http request method (`GET` or `POST`).
         :param api_method: the required method in Telegram API.
         :param parameters: dict of parameters which will used in the Telegram API method.
         """
 
-        parameters_string = '&'.join([f'{k}={v}' for k, v in parameters.items()])
+        request_url = f"{TELEGRAM_API_URL}/bot{self.bot_token}/{api_method}"
+        session = getHTTPSession()
+
+        for attempt in range(self.max_retries + 1):
+            if api_method in SEND_METHODS:
+                time.sleep(self.send_rate_limiter.reserve(parameters.get('chat_id')))
 
-        request_url = f"https://api.telegram.org/bot{self.bot_token}/{api_method}?{parameters_string}"
+            if request_method.upper() == 'GET':
+                r = session.get(request_url, params=parameters, timeout=self.timeout)
+            else:
+                r = session.post(request_url, json=parameters, timeout=self.timeout)
 
-        if request_method == 'GET':
-            r = requests.get(request_url)
-        elif request_method == 'POST':
-            r = requests.post(request_url)
+            if r.status_code != 429 or attempt == self.max_retries:
+                break
+            retry_after = getRetryAfter(r.text)
+            if retry_after > self.max_retry_after:
+                break
+            time.sleep(retry_after)
 
         response = {
             'code': r.status_code,
             'text': r.text,
         }
-        
+
+        return response
+
+    def sendMessage(self, chat_id: int | str, text: str, **parameters) -> dict:
+        return self.sendRequest(
+            request_method='POST',
+            api_method='sendMessage',
+            parameters={'chat_id': chat_id, 'text': text, **parameters}
+        )
+
+    def sendMessages(self, chat_ids: list, text: str, concurrency: int = 8, **parameters) -> list[dict]:
+        """
+        Sends the message to many chats concurrently.
+
+        Returns the responses in the order of `chat_ids`,
+        a failed request gets `None` code and the error text.
+        """
+
+        def sendChatMessage(chat_id: int | str) -> dict:
+            try:
+                return self.sendMessage(chat_id, text, **parameters)
+            except requests.RequestException as e:
+                return {'code': None, 'text': str(e)}
+
+        if not chat_ids:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(chat_ids))) as executor:
+            return list(executor.map(sendChatMessage, chat_ids))
+
+
+class AsyncTelegramAPI:
+    """asyncio front-end of `TelegramAPI`, requires aiohttp."""
+
+    def __init__(
+        self,
+        bot_token: str,
+        connect_timeout: float = 5,
+        read_timeout: float = 15,
+        max_retries: int = 3,
+        max_retry_after: float = 5,
+        session: 'aiohttp.ClientSession' = None
+    ) -> None:
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is required for AsyncTelegramAPI')
+
+        self.bot_token = bot_token
+        self.timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.send_rate_limiter = getSendRateLimiter(bot_token)
+        self.session = session
+        self.own_session = session is None
+
+    async def __aenter__(self) -> 'AsyncTelegramAPI':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def getSession(self) -> 'aiohttp.ClientSession':
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=32)
+            )
+            self.own_session = True
+        return self.session
+
+    async def close(self) -> None:
+        if self.own_session and self.session and not self.session.closed:
+            await self.session.close()
+
+    async def sendRequest(self, request_method: str, api_method: str, parameters: dict = {}) -> dict:
+        "Sends request to Telegram API, see `TelegramAPI.sendRequest`."
+
+        request_url = f"{TELEGRAM_API_URL}/bot{self.bot_token}/{api_method}"
+        session = self.getSession()
+
+        for attempt in range(self.max_retries + 1):
+            if api_method in SEND_METHODS:
+                await asyncio.sleep(self.send_rate_limiter.reserve(parameters.get('chat_id')))
+
+            if request_method.upper() == 'GET':
+                request = session.get(request_url, params=parameters, timeout=self.timeout)
+            else:
+                request = session.post(request_url, json=parameters, timeout=self.timeout)
+            async with request as r:
+                status_code = r.status
+                text = await r.text()
+
+            if status_code != 429 or attempt == self.max_retries:
+                break
+            retry_after = getRetryAfter(text)
+            if retry_after > self.max_retry_after:
+                break
+            await asyncio.sleep(retry_after)
+
+        response = {
+            'code': status_code,
+            'text': text,
+        }
+
         return response
+
+    async def sendMessage(self, chat_id: int | str, text: str, **parameters) -> dict:
+        return await self.sendRequest(
+            request_method='POST',
+            api_method='sendMessage',
+            parameters={'chat_id': chat_id, 'text': text, **parameters}
+        )
+
+    async def sendMessages(self, chat_ids: list, text: str, concurrency: int = 8, **parameters) -> list[dict]:
+        "Sends the message to many chats concurrently, see `TelegramAPI.sendMessages`."
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def sendChatMessage(chat_id: int | str) -> dict:
+            async with semaphore:
+                try:
+                    return await self.sendMessage(chat_id, text, **parameters)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    return {'code': None, 'text': str(e)}
+
+        return list(await asyncio.gather(*(sendChatMessage(chat_id) for chat_id in chat_ids)))
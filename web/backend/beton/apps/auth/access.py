@@ -4,11 +4,52 @@ from django.http import JsonResponse
 from utils import makeResponseData, getCurrentDateTime
 
 from apps.auth.models import AuthToken
-from apps.auth.utils import hashAuthToken
+from apps.auth.utils import hashAuthToken, splitAuthToken
+from apps.auth.caching import getCachedAuthToken, cacheAuthToken
 
 import secrets
 
 
+def matchAuthTokenRecord(potential_tokens: list[dict], verifier: str) -> dict | None:
+    """
+    Returns the candidate record whose hash matches the verifier.
+
+    The candidates are the records of the token selector, or all the active legacy records
+    when the token has no selector or its selector has no record (the whole token is the verifier then).
+    """
+
+    for token_record in potential_tokens:
+        salt = bytes.fromhex(token_record['salt_hex'])
+        cadidate_token_hash, salt_hex = hashAuthToken(verifier, salt)
+
+        if secrets.compare_digest(cadidate_token_hash, token_record['token_hash']):
+            return token_record
+
+
+def getAuthTokenRecord(plain_token: str) -> dict | None:
+    """
+    Finds the active auth token record matching the plain token.
+
+    Tokens with a selector are found by one indexed query and verified with a single hash.
+    Legacy tokens without a selector fall back to checking every active legacy record,
+    as do the tokens whose selector has no record (a legacy token may contain the separator).
+    """
+
+    active_tokens = AuthToken.objects.filter(
+        Q(expires_at__gt=getCurrentDateTime()) | Q(expires_at__isnull=True), revoked=False
+    )
+    fields = ('id', 'token_hash', 'salt_hex', 'expires_at')
+
+    selector, verifier = splitAuthToken(plain_token)
+    if selector:
+        potential_tokens = list(active_tokens.filter(selector=selector).values(*fields))
+        if potential_tokens:
+            return matchAuthTokenRecord(potential_tokens, verifier)
+
+    potential_tokens = active_tokens.filter(selector__isnull=True).values(*fields)
+    return matchAuthTokenRecord(potential_tokens, plain_token)
+
+
 def checkAuthToken(view_func):
     "Verifies the authenticity of the transmitted authorization token before executing the request."
 
@@ -18,17 +59,15 @@ def checkAuthToken(view_func):
         if auth_header:
             plain_token = auth_header.split()[1]
 
-            potential_tokens = AuthToken.objects.filter(
-                Q(expires_at__gt=getCurrentDateTime()) | Q(expires_at__isnull=True), revoked=False
-            ).values('token_hash', 'salt_hex')
-
-            for token_record in potential_tokens:
-                salt = bytes.fromhex(token_record['salt_hex'])
-                cadidate_token_hash, salt_hex = hashAuthToken(plain_token, salt)
+            token_record = getCachedAuthToken(plain_token)
+            if not token_record:
+                token_record = getAuthTokenRecord(plain_token)
+                if token_record:
+                    cacheAuthToken(plain_token, token_record)
 
-                if secrets.compare_digest(cadidate_token_hash, token_record['token_hash']):
-                    result = view_func(*args, **kwargs)
-                    return result
+            if token_record:
+                result = view_func(*args, **kwargs)
+                return result
 
         response_data = makeResponseData(status=403, message='Invalid auth token')
         return JsonResponse(response_data, status=403)
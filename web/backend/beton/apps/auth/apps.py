@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AuthConfig(AppConfig):
     name = 'apps.auth'
+
+    def ready(self):
+        import apps.auth.signals
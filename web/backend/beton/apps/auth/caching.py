@@ -0,0 +1,174 @@
+from django.conf import settings
+
+import logs
+from utils import getCurrentDateTime
+from cache import Cache, LocalCache, CircuitBreaker
+
+import os
+import json
+import redis
+import hashlib
+import threading
+from datetime import datetime
+
+
+AUTH_TOKENS_CHANNEL = 'auth_tokens:invalidations'
+
+cache_settings: dict = settings.AUTH_TOKEN_CACHE
+local_cache = LocalCache(
+    max_size=cache_settings['LOCAL_MAX_SIZE'],
+    expire=cache_settings['LOCAL_EXPIRE']
+)
+
+listener_lock = threading.Lock()
+listener = {'thread': None, 'pid': None}
+# After a failed start the listener isn't restarted on every request while Redis is down
+listener_circuit_breaker = CircuitBreaker(
+    failure_threshold=1, 
+    reset_timeout=cache_settings['LISTENER_RETRY_TIMEOUT']
+)
+
+
+def getTokenDigest(plain_token: str) -> str:
+    return hashlib.sha256(plain_token.encode('utf-8')).hexdigest()
+
+
+def getTokenExpire(token_record: dict, max_expire: int) -> int:
+    "Bounds the cache entry lifetime by the token expiration time."
+
+    expires_at: datetime | None = token_record['expires_at']
+    if expires_at is None:
+        return max_expire
+    seconds_left = int((expires_at - getCurrentDateTime()).total_seconds())
+    return min(max_expire, seconds_left)
+
+
+def handleInvalidationMessage(message: dict) -> None:
+    token_id = int(message['data'])
+    local_cache.deleteWhere(lambda key, token_record: token_record['id'] == token_id)
+
+
+def handleListenerException(exception, pubsub, thread) -> None:
+    """
+    Stops the broken listener and forgets the local entries,
+    since invalidations can't be received until the listener is restarted.
+    """
+
+    thread.stop()
+    pubsub.close()
+    local_cache.clear()
+
+
+def subscribeListener() -> redis.client.PubSub:
+    pubsub = Cache().redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{AUTH_TOKENS_CHANNEL: handleInvalidationMessage})
+    return pubsub
+
+
+def ensureListener() -> bool:
+    """
+    Starts the invalidation listener of the current worker process if it isn't running yet
+    and returns whether it runs. A failed start is retried only after `LISTENER_RETRY_TIMEOUT`.
+    """
+
+    thread = listener['thread']
+    if thread and thread.is_alive() and listener['pid'] == os.getpid():
+        return True
+
+    with listener_lock:
+        thread = listener['thread']
+        if thread and thread.is_alive() and listener['pid'] == os.getpid():
+            return True
+
+        local_cache.clear()
+        try:
+            pubsub = listener_circuit_breaker.call(subscribeListener)
+        except redis.RedisError:
+            return False
+
+        listener['thread'] = pubsub.run_in_thread(
+            sleep_time=1,
+            daemon=True,
+            exception_handler=handleListenerException
+        )
+        listener['pid'] = os.getpid()
+        return True
+
+
+def getCachedAuthToken(plain_token: str) -> dict | None:
+    """
+    Returns the verified token record from the in-process cache or from Redis.
+
+    The in-process tier is used only while the worker receives invalidation messages.
+    """
+
+    digest = getTokenDigest(plain_token)
+
+    use_local_cache = ensureListener()
+    if use_local_cache:
+        token_record = local_cache.getValue(digest)
+        if token_record:
+            return token_record
+
+    try:
+        token_record = Cache().getValue(f'auth_tokens:{digest}')
+    except redis.RedisError:
+        return None
+    if not token_record:
+        return None
+
+    token_record = json.loads(token_record)
+    if token_record['expires_at']:
+        token_record['expires_at'] = datetime.fromisoformat(token_record['expires_at'])
+
+    if use_local_cache:
+        expire = getTokenExpire(token_record, max_expire=cache_settings['LOCAL_EXPIRE'])
+        if expire > 0:
+            local_cache.setValue(digest, token_record, expire=expire)
+
+    return token_record
+
+
+def cacheAuthToken(plain_token: str, token_record: dict) -> None:
+    "Saves the verified token record to both cache tiers."
+
+    digest = getTokenDigest(plain_token)
+    token_record = {'id': token_record['id'], 'expires_at': token_record['expires_at']}
+
+    expire = getTokenExpire(token_record, max_expire=cache_settings['REDIS_EXPIRE'])
+    if expire <= 0:
+        return
+
+    try:
+        cache = Cache()
+        pipeline = cache.redis_client.pipeline()
+        pipeline.set(f'auth_tokens:{digest}', json.dumps(token_record, default=datetime.isoformat), ex=expire)
+        pipeline.sadd(f'auth_tokens:{token_record["id"]}:digests', digest)
+        pipeline.expire(f'auth_tokens:{token_record["id"]}:digests', cache_settings['REDIS_EXPIRE'])
+        pipeline.execute()
+    except redis.RedisError:
+        return
+
+    if ensureListener():
+        local_expire = min(expire, cache_settings['LOCAL_EXPIRE'])
+        local_cache.setValue(digest, token_record, expire=local_expire)
+
+
+def invalidateAuthToken(token_id: int) -> None:
+    "Evicts the token from Redis and from the in-process cache of every worker."
+
+    local_cache.deleteWhere(lambda key, token_record: token_record['id'] == token_id)
+
+    try:
+        cache = Cache()
+        digests_key = f'auth_tokens:{token_id}:digests'
+        for digest in cache.getSetMembers(digests_key):
+            cache.deleteKey(f'auth_tokens:{digest}')
+        cache.deleteKey(digests_key)
+        cache.publishMessage(AUTH_TOKENS_CHANNEL, str(token_id))
+    except redis.RedisError as e:
+        logs.addLog(
+            level='warning',
+            message=f"Auth token #{token_id} cache invalidation failed.",
+            details=str(e)
+        )
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from utils import getCurrentDateTime
+
+from apps.auth.models import User, AuthToken
+from apps.auth.utils import makeAuthToken
+
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+    help = (
+        'Issues a new `<selector>.<verifier>` auth token for the user. '
+        'Use it to rotate legacy tokens, which are verified by a slower scan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_name', help='Name of the token owner.')
+        parser.add_argument('--days', type=int, default=None, help='Token lifetime in days (unlimited by default).')
+        parser.add_argument(
+            '--revoke-legacy', 
+            action='store_true', 
+            help='Revoke the user tokens issued without a selector.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(name=options['user_name'])
+        except User.DoesNotExist:
+            raise CommandError(f"User \"{options['user_name']}\" does not exist")
+
+        expires_at = None
+        if options['days']:
+            expires_at = getCurrentDateTime() + timedelta(days=options['days'])
+
+        plain_token, selector, token_hash, salt_hex = makeAuthToken()
+        AuthToken.objects.create(
+            user=user, 
+            selector=selector, 
+            token_hash=token_hash, 
+            salt_hex=salt_hex, 
+            expires_at=expires_at
+        )
+
+        if options['revoke_legacy']:
+            legacy_tokens = AuthToken.objects.filter(user=user, selector__isnull=True, revoked=False)
+            for token in legacy_tokens:
+                token.revoked = True
+                token.save(update_fields=['revoked'])
+
+        self.stdout.write(plain_token)
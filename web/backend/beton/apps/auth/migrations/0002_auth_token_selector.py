@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authtoken',
+            name='selector',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -16,6 +16,7 @@ class User(models.Model):
 class AuthToken(models.Model):
     id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    selector = models.CharField(max_length=32, unique=True, null=True, blank=True)
     token_hash = models.CharField(max_length=128)
     salt_hex = models.CharField(max_length=32)
     created_at = models.DateTimeField(auto_now_add=True)
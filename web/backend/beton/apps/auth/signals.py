@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.db import transaction
+
+from apps.auth.models import AuthToken
+from apps.auth.caching import invalidateAuthToken
+
+
+@receiver(post_save, sender=AuthToken)
+@receiver(post_delete, sender=AuthToken)
+def AuthTokenChangeHandler(sender, instance, created: bool = False, **kwargs):
+    """
+    Evicts the changed token from the verified tokens cache.
+
+    The eviction is repeated after the commit, so a request that read
+    the old row state during the transaction can't leave a stale entry.
+    """
+
+    if created:
+        return
+
+    invalidateAuthToken(instance.id)
+    token_id = instance.id
+    transaction.on_commit(lambda: invalidateAuthToken(token_id))
@@ -3,6 +3,9 @@ import secrets
 import base64
 
 
+AUTH_TOKEN_SEPARATOR = '.'
+
+
 def hashAuthToken(token: str, salt: bytes = None) -> tuple[str, str]:
     """
     Hash a token using SHA-256 with salt.
@@ -22,3 +25,34 @@ def hashAuthToken(token: str, salt: bytes = None) -> tuple[str, str]:
     
     # Return base64 encoded hash and hex encoded salt
     return base64.b64encode(hashed).decode('utf-8'), salt.hex()
+
+
+def makeAuthToken() -> tuple[str, str, str, str]:
+    """
+    Generate a new `<selector>.<verifier>` auth token.
+
+    The selector is a non-secret lookup identifier stored as is,
+    only the verifier is hashed.
+
+    Returns the plain token, its selector, the verifier hash and the salt hex.
+    """
+
+    selector = secrets.token_hex(8)
+    verifier = secrets.token_urlsafe(32)
+    token_hash, salt_hex = hashAuthToken(verifier)
+    plain_token = f'{selector}{AUTH_TOKEN_SEPARATOR}{verifier}'
+    return plain_token, selector, token_hash, salt_hex
+
+
+def splitAuthToken(plain_token: str) -> tuple[str | None, str]:
+    """
+    Split a plain token into its selector and verifier.
+
+    Legacy tokens issued before the selector was introduced have no selector,
+    the whole token is their verifier.
+    """
+
+    selector, separator, verifier = plain_token.partition(AUTH_TOKEN_SEPARATOR)
+    if separator and selector and verifier:
+        return selector, verifier
+    return None, plain_token
@@ -0,0 +1,235 @@
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+
+import logs
+from cache import Cache, LocalCache, CircuitBreaker
+
+import json
+import redis
+import hashlib
+import functools
+from typing import Callable
+
+
+cache_settings: dict = settings.CATALOG_CACHE
+local_cache = LocalCache(
+    max_size=cache_settings['LOCAL_MAX_SIZE'],
+    expire=cache_settings['LOCAL_EXPIRE']
+)
+circuit_breaker = CircuitBreaker(
+    failure_threshold=cache_settings['CIRCUIT_BREAKER']['FAILURE_THRESHOLD'],
+    reset_timeout=cache_settings['CIRCUIT_BREAKER']['RESET_TIMEOUT']
+)
+
+
+VERSIONS_SCRIPT = """
+-- The versions are the bump times in milliseconds, kept strictly increasing,
+-- so they don't repeat after the keys are lost and give the modification times.
+-- With ARGV[1] == 'init' only the missing versions are set.
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local versions = {}
+for i, key in ipairs(KEYS) do
+    local version = tonumber(redis.call('GET', key) or '0')
+    if ARGV[1] ~= 'init' or version == 0 then
+        version = math.max(now, version + 1)
+        redis.call('SET', key, string.format('%d', version))
+    end
+    versions[i] = version
+end
+return versions
+"""
+
+versions_script = {'script': None}
+
+
+def getVersionKey(namespace: str) -> str:
+    return f'store:versions:{namespace}'
+
+
+def runVersionsScript(namespaces: tuple, mode: str = 'bump') -> list[int]:
+    if versions_script['script'] is None:
+        versions_script['script'] = Cache().registerScript(VERSIONS_SCRIPT)
+    versions = versions_script['script'](keys=[getVersionKey(namespace) for namespace in namespaces], args=[mode])
+    return [int(version) for version in versions]
+
+
+def getNamespacesVersions(namespaces: tuple) -> list[int]:
+    "Returns the current versions of the namespaces in a single round trip."
+
+    versions = Cache().redis_client.mget([getVersionKey(namespace) for namespace in namespaces])
+    if None in versions:
+        return runVersionsScript(namespaces, mode='init')
+    return [int(version) for version in versions]
+
+
+def getRequestVersions(request: Request, namespaces: tuple) -> list[int]:
+    "Returns the namespaces versions read once per request, raises `redis.RedisError` while Redis is unavailable."
+
+    if not hasattr(request, 'namespaces_versions'):
+        request.namespaces_versions = {}
+    if namespaces not in request.namespaces_versions:
+        request.namespaces_versions[namespaces] = circuit_breaker.call(getNamespacesVersions, namespaces)
+    return request.namespaces_versions[namespaces]
+
+
+def bumpNamespacesVersions(*namespaces: str) -> None:
+    "Makes the cached responses depending on the namespaces unreachable, they expire by themselves."
+
+    try:
+        circuit_breaker.call(runVersionsScript, namespaces)
+    except redis.RedisError as e:
+        logs.addLog(
+            level='warning',
+            message=f"Store namespaces {namespaces} invalidation failed.",
+            details=str(e)
+        )
+
+
+def invalidateNamespaces(*namespaces: str) -> None:
+    """
+    Bumps the namespaces versions now and once more after the commit,
+    so a response read from the uncommitted state can't stay reachable.
+    """
+
+    bumpNamespacesVersions(*namespaces)
+    transaction.on_commit(lambda: bumpNamespacesVersions(*namespaces))
+
+
+def getResponseKey(view_name: str, request: Request, versions: list[int]) -> str:
+    query = sorted(request.query_params.lists())
+    request_digest = hashlib.sha1(json.dumps([request.path, query]).encode('utf-8')).hexdigest()
+    versions_string = '.'.join(map(str, versions))
+    return f'catalog:responses:{view_name}:{versions_string}:{request_digest}'
+
+
+def cacheResponse(namespaces: tuple) -> Callable:
+    """
+    Caches the successful responses of a view method in Redis and in the in-process cache.
+
+    The key consists of the view name, the request path with its query parameters
+    and the current versions of the namespaces the response depends on.
+    The cache is bypassed while Redis is unavailable.
+    """
+
+    def container(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request: Request, *args, **kwargs) -> Response:
+            try:
+                versions = getRequestVersions(request, namespaces)
+            except redis.RedisError:
+                return view_method(self, request, *args, **kwargs)
+
+            key = getResponseKey(self.__class__.__name__, request, versions)
+
+            response_data = local_cache.getValue(key)
+            if response_data is not None:
+                return Response(response_data, status=200)
+
+            try:
+                cached_response = circuit_breaker.call(Cache().getValue, key)
+            except redis.RedisError:
+                cached_response = None
+            if cached_response:
+                response_data = json.loads(cached_response)
+                local_cache.setValue(key, response_data)
+                return Response(response_data, status=200)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                serialized_response = json.dumps(response.data, cls=JSONEncoder)
+                try:
+                    circuit_breaker.call(
+                        Cache().setValue, key, serialized_response, expire=cache_settings['REDIS_EXPIRE']
+                    )
+                except redis.RedisError:
+                    pass
+                local_cache.setValue(key, json.loads(serialized_response))
+            return response
+        return wrapper
+    return container
+
+
+def getETag(view_name: str, request: Request, versions: list[int]) -> str:
+    "Returns the strong ETag of a response, computed from the namespaces versions without rendering the body."
+
+    renderer_format = getattr(request, 'accepted_renderer', None) and request.accepted_renderer.format
+    query = sorted(request.query_params.lists())
+    etag_source = json.dumps([view_name, request.path, query, renderer_format, versions])
+    return '"{}"'.format(hashlib.sha1(etag_source.encode('utf-8')).hexdigest())
+
+
+def getIfNoneMatch(request: Request) -> list:
+    """Returns the entity tags listed in `If-None-Match`."""
+
+    if_none_match = request.headers.get('If-None-Match', '')
+    return [candidate.strip() for candidate in if_none_match.split(',') if candidate.strip()]
+
+
+def isNotModified(request: Request, etag: str, last_modified: int) -> bool:
+    """
+    Tells whether the conditional request matches the current validators.
+
+    `If-None-Match: *` is not matched here: it only applies when the resource exists,
+    which is known after the view has run.
+
+    `last_modified` is in milliseconds. `If-Modified-Since` has a one-second resolution,
+    so a change later in the same second as the header can't be told apart from the one
+    the header came with: a modification within that second is never answered with 304.
+    """
+
+    etags = getIfNoneMatch(request)
+    if etags:
+        return etag in etags
+
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and last_modified < if_modified_since * 1000
+
+
+def conditionalResponse(namespaces: tuple, cache_control: str) -> Callable:
+    """
+    Adds `ETag`, `Last-Modified` and `Cache-Control` to the successful responses of a view method
+    and answers `304 Not Modified` to the matching conditional requests without running the view.
+    `If-None-Match: *` is answered with 304 only once the view has found the resource.
+
+    The validators are computed from the versions of the namespaces the response depends on.
+    """
+
+    def container(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request: Request, *args, **kwargs) -> Response:
+            try:
+                versions = getRequestVersions(request, namespaces)
+            except redis.RedisError:
+                versions = None
+
+            if versions is None:
+                response = view_method(self, request, *args, **kwargs)
+                response['Cache-Control'] = cache_control
+                return response
+
+            etag = getETag(self.__class__.__name__, request, versions)
+            # The versions are the modification times in milliseconds
+            last_modified = max(versions)
+
+            if isNotModified(request, etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if '*' in getIfNoneMatch(request):
+                    response = Response(status=304)
+
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified // 1000)
+            response['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return container
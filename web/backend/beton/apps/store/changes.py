@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db import transaction
+
+import logs
+from cache import Cache
+
+from apps.store.caching import circuit_breaker, getVersionKey, getNamespacesVersions
+
+import redis
+
+
+ORDER_CHANGES_KEY = 'store:orders:changes'
+
+ORDER_CHANGES_SCRIPT = """
+-- Bumps the `order` namespace version like the versions script
+-- and adds the changed orders to the feed with it as the score in the same step,
+-- so a reader can't see the new version before the changes it covers.
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local version = math.max(now, tonumber(redis.call('GET', KEYS[1]) or '0') + 1)
+redis.call('SET', KEYS[1], string.format('%d', version))
+
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[2], version, ARGV[i])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', version - tonumber(ARGV[1]))
+return version
+"""
+
+order_changes_script = {'script': None}
+
+
+def addOrderChanges(order_ids: list[str]) -> int:
+    "Adds the orders to the change feed and returns the new `order` version."
+
+    if order_changes_script['script'] is None:
+        order_changes_script['script'] = Cache().registerScript(ORDER_CHANGES_SCRIPT)
+    retention = settings.ORDER_CHANGES['RETENTION'] * 1000
+    version = order_changes_script['script'](
+        keys=[getVersionKey('order'), ORDER_CHANGES_KEY],
+        args=[retention, *order_ids]
+    )
+    return int(version)
+
+
+def recordOrderChange(order_id: str) -> None:
+    "Adds the order to the change feed after the commit, a lost change is covered by the readers caches TTL."
+
+    def addChange():
+        try:
+            circuit_breaker.call(addOrderChanges, [str(order_id)])
+        except redis.RedisError as e:
+            logs.addLog(
+                level='warning',
+                message=f"Order #{order_id} change recording failed.",
+                details=str(e)
+            )
+
+    transaction.on_commit(addChange)
+
+
+def getOrderChanges(since: int) -> dict:
+    """
+    Returns the ids of the orders changed after the `since` version and the current version.
+
+    `reset` tells the reader to drop everything it keeps: `since` is missing, older than the feed retention
+    or newer than the current version (the Redis data was lost), so some changes may be gone.
+    Raises `redis.RedisError` while Redis is unavailable.
+    """
+
+    version = circuit_breaker.call(getNamespacesVersions, ('order',))[0]
+    oldest_version = version - settings.ORDER_CHANGES['RETENTION'] * 1000
+    if since is None or not oldest_version <= since <= version:
+        return {'orders': [], 'version': version, 'reset': True}
+
+    # The changes up to the version read above, the later ones are returned by the next call
+    order_ids = circuit_breaker.call(
+        Cache().redis_client.zrangebyscore, ORDER_CHANGES_KEY, f'({since}', version
+    )
+    return {'orders': [order_id.decode('utf-8') for order_id in order_ids], 'version': version, 'reset': False}
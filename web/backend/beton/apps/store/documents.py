@@ -0,0 +1,87 @@
+from django.db import transaction
+
+from apps.store.models import Product, ProductDocument, ProductDocumentRebuild
+from apps.store.serializers import ProductDocumentSerializer
+from apps.store.caching import invalidateNamespaces
+
+
+def buildProductDocument(product_id: int) -> ProductDocument | None:
+    """
+    Builds and saves the document of the product, returns `None` if the product doesn't exist.
+
+    The product row is locked, so concurrent builds can't save an older state last.
+    """
+
+    with transaction.atomic():
+        products = ProductDocumentSerializer.setupEagerLoading(Product.objects.select_for_update(of=('self',)))
+        try:
+            product = products.get(id=product_id)
+        except Product.DoesNotExist:
+            return None
+
+        product_document, created = ProductDocument.objects.update_or_create(
+            product=product,
+            defaults={'slug': product.slug, 'document': ProductDocumentSerializer(product).data}
+        )
+        return product_document
+
+
+def scheduleProductDocumentsRebuild(product_ids: list[int]) -> None:
+    """
+    Queues the documents rebuild for the `rebuildproductdocuments` worker.
+    The queue rows are added in the current transaction, so the worker sees the changes they were added for.
+    """
+
+    ProductDocumentRebuild.objects.bulk_create(
+        [ProductDocumentRebuild(product_id=product_id) for product_id in set(product_ids)]
+    )
+
+
+def processProductDocumentRebuilds(batch_size: int = 100) -> int:
+    """
+    Rebuilds the documents of a batch of queued products and removes their queue rows.
+
+    Returns the number of rebuilt documents.
+    """
+
+    with transaction.atomic():
+        queued_product_ids = (
+            ProductDocumentRebuild.objects
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('product_id', flat=True)[:batch_size]
+        )
+        product_ids = set(queued_product_ids)
+        if not product_ids:
+            return 0
+
+        # The other queued rebuilds of the same products are covered by this one
+        rebuilds = ProductDocumentRebuild.objects.select_for_update(skip_locked=True).filter(product_id__in=product_ids)
+        rebuild_ids = list(rebuilds.values_list('id', flat=True))
+
+        for product_id in sorted(product_ids):
+            buildProductDocument(product_id)
+        ProductDocumentRebuild.objects.filter(id__in=rebuild_ids).delete()
+
+        # The validators of the documents responses change with the documents
+        invalidateNamespaces('product_document')
+
+    return len(product_ids)
+
+
+def getProductDocument(product_slug: str) -> dict | None:
+    """
+    Returns the product document in a single lookup, building it on a miss.
+    A queued rebuild is done by the worker, meanwhile the previous document is returned.
+    """
+
+    document = ProductDocument.objects.filter(slug=product_slug).values_list('document', flat=True).first()
+    if document is not None:
+        return document
+
+    product_id = Product.objects.filter(slug=product_slug).values_list('id', flat=True).first()
+    if product_id is None:
+        return None
+
+    product_document = buildProductDocument(product_id)
+    return product_document.document if product_document else None
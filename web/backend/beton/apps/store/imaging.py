@@ -0,0 +1,62 @@
+from PIL import Image, ImageOps
+
+from io import BytesIO
+
+
+# The size limit and quality the images were saved with by django-resized
+WEBP_MAX_SIZE = (1920, 1080)
+WEBP_QUALITY = 90
+
+# Widths of the smaller copies for `srcset`, only the ones narrower than the image are made
+RENDITION_WIDTHS = (320, 640, 1280)
+
+
+def saveWebp(image: Image.Image, quality: int) -> bytes:
+    output = BytesIO()
+    image.save(output, format='WEBP', quality=quality)
+    return output.getvalue()
+
+
+def fitImage(image: Image.Image, max_size: tuple) -> Image.Image:
+    "Applies the EXIF orientation to the pixels, fits the image into `max_size` and drops the metadata."
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def processImage(
+    image_bytes: bytes, 
+    convert: bool = True, 
+    rendition_widths: tuple = RENDITION_WIDTHS, 
+    max_size: tuple = WEBP_MAX_SIZE, 
+    quality: int = WEBP_QUALITY
+) -> dict:
+    """
+    Converts an uploaded image to WEBP (unless `convert` is false) and makes its renditions.
+
+    Returns `{'image': bytes | None, 'width': int, 'renditions': {width: bytes}}`.
+    Works with bytes only, so it can run in a separate process.
+    """
+
+    with Image.open(BytesIO(image_bytes)) as image:
+        image = fitImage(image, max_size)
+        width, height = image.size
+
+        renditions = {}
+        for rendition_width in sorted(rendition_widths):
+            if rendition_width >= width:
+                break
+            rendition_height = max(round(height * rendition_width / width), 1)
+            rendition = image.resize((rendition_width, rendition_height), Image.Resampling.LANCZOS)
+            renditions[rendition_width] = saveWebp(rendition, quality)
+
+        return {
+            'image': saveWebp(image, quality) if convert else None,
+            'width': width,
+            'renditions': renditions,
+        }
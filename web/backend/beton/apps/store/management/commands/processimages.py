@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+import logs
+
+from apps.store.processing import processPendingImages
+
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+
+class Command(BaseCommand):
+    help = 'Converts the uploaded images to WEBP in a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process pending images and exit.')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--workers', type=int, default=None, help='Number of worker processes.')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds to wait when nothing is pending.')
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                close_old_connections()
+                try:
+                    processed_count = processPendingImages(batch_size=options['batch_size'], executor=executor)
+                except Exception:
+                    logs.addLog(level='error', message=traceback.format_exc())
+                    processed_count = 0
+
+                if options['once'] and not processed_count:
+                    break
+                if not processed_count:
+                    time.sleep(options['interval'])
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+import logs
+
+from apps.store.models import Product
+from apps.store.documents import buildProductDocument, processProductDocumentRebuilds
+
+import time
+import traceback
+
+
+class Command(BaseCommand):
+    help = 'Drains the product documents rebuild queue, or builds the documents of all the products with `--all`.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', 
+            help='Build the documents of all the products and exit, e.g. after the documents format has changed.'
+        )
+        parser.add_argument('--once', action='store_true', help='Rebuild the queued documents and exit.')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            self.buildAllDocuments()
+            return
+
+        while True:
+            close_old_connections()
+            try:
+                processed_count = processProductDocumentRebuilds(batch_size=options['batch_size'])
+            except Exception:
+                logs.addLog(level='error', message=traceback.format_exc())
+                processed_count = 0
+
+            if options['once'] and not processed_count:
+                break
+            if not processed_count:
+                time.sleep(options['interval'])
+
+    def buildAllDocuments(self) -> None:
+        product_ids = Product.objects.order_by('id').values_list('id', flat=True)
+        for product_id in product_ids.iterator():
+            buildProductDocument(product_id)
+        self.stdout.write(f'Built {len(product_ids)} product documents.')
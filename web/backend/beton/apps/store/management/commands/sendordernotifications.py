@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+import logs
+
+from apps.store.notifications import processOrderNotifications
+
+import time
+import traceback
+
+
+class Command(BaseCommand):
+    help = 'Drains the order notifications outbox, sending them to the telegram bot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process due notifications and exit.')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of parallel requests.')
+        parser.add_argument('--max-attempts', type=int, default=8)
+        parser.add_argument('--lease', type=int, default=60, help='Seconds a claimed notification is reserved.')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to wait when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                processed_count = processOrderNotifications(
+                    batch_size=options['batch_size'],
+                    concurrency=options['concurrency'],
+                    max_attempts=options['max_attempts'],
+                    lease=options['lease']
+                )
+            except Exception:
+                logs.addLog(level='error', message=traceback.format_exc())
+                processed_count = 0
+
+            if options['once'] and not processed_count:
+                break
+            if not processed_count:
+                time.sleep(options['interval'])
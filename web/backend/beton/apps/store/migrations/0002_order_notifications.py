@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNotification',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('chat_id', models.CharField(max_length=50)),
+                ('status', models.CharField(default='pending', max_length=30)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='store.order')),
+            ],
+            options={
+                'db_table': 'order_notifications',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='order_notif_status_287901_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:48
+
+import apps.store.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_product_documents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_status',
+            field=models.CharField(default='ready', max_length=30),
+        ),
+        # The existing images were converted on upload
+        migrations.AddField(
+            model_name='productvariantimage',
+            name='status',
+            field=models.CharField(default='ready', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='productvariantimage',
+            name='status',
+            field=models.CharField(default='pending', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=apps.store.utils.getCategoryImageLocation),
+        ),
+        migrations.AlterField(
+            model_name='productvariantimage',
+            name='image',
+            field=models.ImageField(blank=True, upload_to=apps.store.utils.getProductVariantImageLocation),
+        ),
+    ]
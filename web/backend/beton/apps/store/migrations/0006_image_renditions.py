@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_image_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariantimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_order_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDocumentRebuild',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('product_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'product_document_rebuilds',
+            },
+        ),
+    ]
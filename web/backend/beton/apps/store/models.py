@@ -1,31 +1,67 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
-from django_resized import ResizedImageField
 
 from apps.store import utils
 
 import uuid
 
 
+# Uploaded images are stored as is and converted to WEBP by the `processimages` worker.
+# The same image content is stored once and shared by the rows (see `deduplicateImage`).
+IMAGE_STATUS_PENDING = 'pending'
+IMAGE_STATUS_READY = 'ready'
+IMAGE_STATUS_FAILED = 'failed'
+
+
 class Category(models.Model):
     id = models.BigAutoField(primary_key=True)
     slug = models.SlugField(max_length=100, unique=True)
     title = models.CharField(max_length=50, unique=True)
     description = models.TextField(null=True, blank=True)
-    image = ResizedImageField(
-        upload_to=utils.getCategoryImageLocation,
-        force_format='WEBP',
-        quality=90,
-        null=True,
-        blank=True
-    )
+    image = models.ImageField(upload_to=utils.getCategoryImageLocation, null=True, blank=True)
+    image_status = models.CharField(max_length=30, default=IMAGE_STATUS_READY)
+    image_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'categories'
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title, allow_unicode=True)
-        super().save(*args, **kwargs)
+        if not self.image:
+            self.image_hash = ''
+
+        # The original row of a reused image stays locked until the row referring to it is saved
+        with transaction.atomic():
+            if self.image and not self.image._committed:
+                self.deduplicateImage()
+            super().save(*args, **kwargs)
+
+    def deduplicateImage(self) -> None:
+        """
+        Reuses the stored image with the same content instead of the new upload.
+
+        The original row is locked, so its deletion can't release the files before this row refers to them.
+        Must be called in a transaction.
+        """
+
+        self.image_hash = utils.getImageHash(self.image)
+        original = (
+            Category.objects
+            .select_for_update()
+            .filter(image_hash=self.image_hash)
+            .exclude(image='')
+            .exclude(image__isnull=True)
+            .exclude(image_status=IMAGE_STATUS_FAILED)
+            .exclude(pk=self.pk)
+            .first()
+        )
+        if original:
+            self.image = original.image.name
+            self.image_status = original.image_status
+        else:
+            self.image_status = IMAGE_STATUS_PENDING
 
     def __str__(self):
         return self.title
@@ -43,6 +79,7 @@ class Product(models.Model):
         blank=True, 
         related_name='products'
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'products'
@@ -63,6 +100,7 @@ class ProductVariant(models.Model):
     configuration = models.JSONField(null=True, blank=True)
     price = models.DecimalField(max_digits=12, decimal_places=2)
     stock = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'product_variants'
@@ -78,16 +116,75 @@ class ProductVariant(models.Model):
 class ProductVariantImage(models.Model):
     id = models.BigAutoField(primary_key=True)
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='images')
-    image = ResizedImageField(
-        upload_to=utils.getProductVariantImageLocation,
-        force_format='WEBP',
-        quality=90,
-        blank=True
-    )
+    image = models.ImageField(upload_to=utils.getProductVariantImageLocation, blank=True)
+    status = models.CharField(max_length=30, default=IMAGE_STATUS_PENDING)
+    # Image width -> path of its copy, the image itself included
+    renditions = models.JSONField(default=dict, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
 
     class Meta:
         db_table = 'product_variant_images'
 
+    def save(self, *args, **kwargs):
+        if not self.image:
+            self.content_hash = ''
+
+        with transaction.atomic():
+            if self.image and not self.image._committed:
+                self.deduplicateImage()
+            super().save(*args, **kwargs)
+
+    def deduplicateImage(self) -> None:
+        """
+        Reuses the stored image with the same content (and its renditions) instead of the new upload.
+
+        The original row is locked, so its deletion can't release the files before this row refers to them.
+        Must be called in a transaction, before `bulk_create`, which doesn't call `save`.
+        """
+
+        self.content_hash = utils.getImageHash(self.image)
+        original = (
+            ProductVariantImage.objects
+            .select_for_update()
+            .filter(content_hash=self.content_hash)
+            .exclude(image='')
+            .exclude(status=IMAGE_STATUS_FAILED)
+            .exclude(pk=self.pk)
+            .first()
+        )
+        if original:
+            self.image = original.image.name
+            self.status = original.status
+            self.renditions = original.renditions
+
+
+class ProductDocument(models.Model):
+    """Denormalized product page (product, category, variants and images), rebuilt when any of them changes."""
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='document')
+    slug = models.SlugField(max_length=150, db_index=True)
+    document = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'product_documents'
+
+
+class ProductDocumentRebuild(models.Model):
+    """
+    Outbox of the product documents to rebuild, written in the transaction of the change
+    and drained by the `rebuildproductdocuments` worker.
+
+    `product_id` isn't a foreign key: the rows are added while the products are being deleted.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    product_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'product_document_rebuilds'
+
 
 class Order(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -102,6 +199,10 @@ class Order(models.Model):
 
     class Meta:
         db_table = 'orders'
+        indexes = [
+            # Orders of a status in the order of the list pages
+            models.Index(fields=['status', '-created_at', '-id'])
+        ]
 
 
 class OrderItem(models.Model):
@@ -112,3 +213,23 @@ class OrderItem(models.Model):
     class Meta:
         db_table = 'order_items'
         unique_together = ['order', 'product']
+
+
+class OrderNotification(models.Model):
+    """Outbox of order notifications, written in the order transaction and sent by a separate worker."""
+
+    id = models.BigAutoField(primary_key=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='notifications')
+    chat_id = models.CharField(max_length=50)
+    status = models.CharField(max_length=30, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'order_notifications'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'])
+        ]
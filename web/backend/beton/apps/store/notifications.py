@@ -0,0 +1,165 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+import logs
+from config import project_settings
+from api.telegram import TelegramAPI
+
+from apps.store.models import Order, OrderNotification
+from apps.store.serializers import OrderSerializer
+from apps.store.utils import formatPrice
+
+import json
+import random
+import requests
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+
+def makeOrderNotificationText(order: Order) -> str:
+    order_cart_products = []
+    cart_total_price = 0
+    for i, order_item in enumerate(order.orderitem_set.all()):
+        product = order_item.product
+        quantity = order_item.quantity
+        total_price = product.price * quantity
+        cart_total_price += total_price
+        configuration = ', '.join(f"{k}: {v}" for k, v in (product.configuration or {}).items())
+        order_cart_products.append(
+            f'*{i+1}.* '
+            f'{product.title} ({configuration}) [{quantity} шт.] — '
+            f'*{formatPrice(total_price)}* ({formatPrice(product.price)} / шт.)'
+        )
+    order_cart = '\n\n'.join(order_cart_products)
+
+    message_text = (
+        '*🔔 Получен новый заказ*\n\n'
+
+        f'🤵🏼 Заказчик: *{order.fullname}*\n'
+        f'📞 Номер телефона: `{order.contact}`\n'
+        f'📲 Способ связи: *{order.contact_method}*\n\n'
+
+        '*🛒 Состав заказа:*\n'
+        f'{order_cart}\n\n'
+        
+        f'💰 Сумма заказа: *{formatPrice(cart_total_price)}*'
+    )
+    return message_text
+
+
+def createOrderNotifications(order: Order) -> None:
+    "Adds the order notifications to the outbox, must be called in the order transaction."
+
+    OrderNotification.objects.bulk_create([
+        OrderNotification(order=order, chat_id=str(user_id))
+        for user_id in project_settings.TELEGRAM_ORDERS_BOT_USERS
+    ])
+
+
+def getRetryDelay(attempts: int, response: dict | None) -> float:
+    "Exponential backoff with jitter, Telegram `retry_after` is respected."
+
+    delay = min(2 ** attempts, 15 * 60) * random.uniform(0.5, 1.5)
+
+    if response and response['code'] == 429:
+        try:
+            retry_after = json.loads(response['text'])['parameters']['retry_after']
+            delay = max(delay, retry_after)
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    return delay
+
+
+def claimOrderNotifications(batch_size: int, lease: int) -> list[OrderNotification]:
+    """
+    Takes the due notifications and leases them for `lease` seconds.
+
+    Locked rows are skipped, so several workers can drain the outbox together.
+    A notification whose worker died becomes due again once the lease expires.
+    """
+
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            OrderNotification.objects
+            .select_for_update(skip_locked=True)
+            .filter(status__in=['pending', 'processing'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        notifications_ids = [notification.id for notification in notifications]
+        OrderNotification.objects.filter(id__in=notifications_ids).update(
+            status='processing',
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=lease)
+        )
+
+    for notification in notifications:
+        notification.attempts += 1
+    return notifications
+
+
+def sendOrderNotification(telegram_api: TelegramAPI, chat_id: str, message_text: str) -> dict:
+    try:
+        return telegram_api.sendMessage(chat_id, message_text, parse_mode='Markdown')
+    except requests.RequestException as e:
+        return {'code': None, 'text': str(e)}
+
+
+def processOrderNotifications(
+    batch_size: int = 50, 
+    concurrency: int = 4, 
+    max_attempts: int = 8, 
+    lease: int = 60
+) -> int:
+    """
+    Sends a batch of due notifications concurrently and records the results.
+
+    Returns the number of processed notifications.
+    """
+
+    notifications = claimOrderNotifications(batch_size, lease)
+    if not notifications:
+        return 0
+
+    orders_ids = {notification.order_id for notification in notifications}
+    orders = OrderSerializer.setupEagerLoading(Order.objects.filter(id__in=orders_ids))
+    messages_texts = {order.id: makeOrderNotificationText(order) for order in orders}
+
+    telegram_api = TelegramAPI(bot_token=project_settings.TELEGRAM_ORDERS_BOT_TOKEN)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = executor.map(
+            lambda notification: sendOrderNotification(
+                telegram_api, notification.chat_id, messages_texts[notification.order_id]
+            ),
+            notifications
+        )
+        results = list(zip(notifications, responses))
+
+    now = timezone.now()
+    for notification, response in results:
+        if response['code'] == 200:
+            notification.status = 'sent'
+            notification.sent_at = now
+            notification.last_error = None
+        elif notification.attempts >= max_attempts:
+            notification.status = 'failed'
+            notification.last_error = response['text']
+            logs.addLog(
+                level='error',
+                message=f"Order #{notification.order_id} notification to {notification.chat_id} wasn't sent.",
+                details=response['text']
+            )
+        else:
+            notification.status = 'pending'
+            notification.last_error = response['text']
+            notification.next_attempt_at = now + timedelta(
+                seconds=getRetryDelay(notification.attempts, response)
+            )
+
+    OrderNotification.objects.bulk_update(
+        [notification for notification, response in results],
+        fields=['status', 'sent_at', 'last_error', 'next_attempt_at']
+    )
+    return len(results)
@@ -0,0 +1,128 @@
+from django.db import connection
+from django.db.models import Q, Model, QuerySet
+from django.http import QueryDict
+
+from pydantic import BaseModel, ValidationError
+
+import base64
+import binascii
+
+
+class PaginationError(ValueError):
+    """Raised on invalid pagination query parameters."""
+
+
+class CursorPaginator:
+    """
+    Keyset pagination by an ordering of fields which is unique as a whole.
+
+    A page is selected by comparing the ordering fields with the last item of the previous page
+    instead of skipping rows with OFFSET, so a deep page costs as much as the first one.
+    The position is passed between requests as an opaque cursor.
+    """
+
+    COUNT_MODES = ('exact', 'estimated')
+
+    def __init__(
+        self, 
+        ordering: tuple[str, ...], 
+        cursor_scheme: type[BaseModel], 
+        default_page_size: int = 20, 
+        max_page_size: int = 100
+    ) -> None:
+        """
+        :param ordering: ordering fields, `-` prefix means descending order.
+        :param cursor_scheme: pydantic scheme of the ordering fields values.
+        """
+
+        self.ordering = ordering
+        self.fields = [field.lstrip('-') for field in ordering]
+        self.cursor_scheme = cursor_scheme
+        self.default_page_size = default_page_size
+        self.max_page_size = max_page_size
+
+    def encodeCursor(self, item: Model) -> str:
+        cursor = self.cursor_scheme(**{field: getattr(item, field) for field in self.fields})
+        return base64.urlsafe_b64encode(cursor.model_dump_json().encode('utf-8')).decode('utf-8').rstrip('=')
+
+    def decodeCursor(self, cursor: str) -> BaseModel:
+        try:
+            cursor_json = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            return self.cursor_scheme.model_validate_json(cursor_json)
+        except (binascii.Error, ValueError, ValidationError):
+            raise PaginationError('Cursor is invalid')
+
+    def getPageSize(self, query_params: QueryDict) -> int:
+        page_size = query_params.get('limit')
+        if page_size is None:
+            return self.default_page_size
+
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise PaginationError('Limit must be an integer')
+        if not 1 <= page_size <= self.max_page_size:
+            raise PaginationError(f'Limit must be between 1 and {self.max_page_size}')
+        return page_size
+
+    def makeKeysetFilter(self, cursor: BaseModel) -> Q:
+        "Builds `(a, b) > (cursor.a, cursor.b)` condition respecting each field direction."
+
+        keyset_filter = Q()
+        equal_fields = {}
+        for ordering_field, field in zip(self.ordering, self.fields):
+            lookup = 'lt' if ordering_field.startswith('-') else 'gt'
+            value = getattr(cursor, field)
+            keyset_filter |= Q(**equal_fields, **{f'{field}__{lookup}': value})
+            equal_fields[field] = value
+        return keyset_filter
+
+    def paginate(self, queryset: QuerySet, query_params: QueryDict) -> tuple[list, str | None]:
+        """
+        Returns the page items and the cursor of the next page (`None` for the last page).
+
+        :param query_params: request query parameters with optional `cursor` and `limit`.
+        """
+
+        page_size = self.getPageSize(query_params)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = query_params.get('cursor')
+        if cursor:
+            queryset = queryset.filter(self.makeKeysetFilter(self.decodeCursor(cursor)))
+
+        # One extra item tells whether there is a next page without counting
+        items = list(queryset[:page_size + 1])
+        next_cursor = None
+        if len(items) > page_size:
+            items = items[:page_size]
+            next_cursor = self.encodeCursor(items[-1])
+
+        return items, next_cursor
+
+    def getCount(self, queryset: QuerySet, query_params: QueryDict) -> int | None:
+        """
+        Counts the queryset items if requested by the `count` query parameter.
+
+        `exact` runs COUNT(*), `estimated` uses the PostgreSQL planner statistics
+        for unfiltered querysets and falls back to the exact count otherwise.
+        """
+
+        count_mode = query_params.get('count')
+        if not count_mode:
+            return None
+        if count_mode not in self.COUNT_MODES:
+            raise PaginationError(f"Count must be one of: {', '.join(self.COUNT_MODES)}")
+
+        if count_mode == 'estimated' and not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as db_cursor:
+                db_cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE relname = %s', 
+                    [queryset.model._meta.db_table]
+                )
+                row = db_cursor.fetchone()
+            # Statistics are missing (-1) until the table is analyzed
+            if row and row[0] >= 0:
+                return row[0]
+
+        return queryset.count()
@@ -0,0 +1,233 @@
+from django.db import transaction
+from django.core.files.base import ContentFile
+
+import logs
+
+from apps.store.models import Category, ProductVariantImage, IMAGE_STATUS_PENDING, IMAGE_STATUS_READY, IMAGE_STATUS_FAILED
+from apps.store.imaging import processImage, RENDITION_WIDTHS
+from apps.store.utils import getImageRenditionLocation
+
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+
+# Models with uploaded images, the renditions are made for the models with `renditions_field`
+IMAGE_MODELS = (
+    {'model': ProductVariantImage, 'image_field': 'image', 'status_field': 'status', 'renditions_field': 'renditions'},
+    {'model': Category, 'image_field': 'image', 'status_field': 'image_status', 'renditions_field': None},
+)
+
+# Ready images the renditions couldn't be made for, they stay ready and are skipped until the worker restarts
+failed_renditions = set()
+
+
+def getPendingImages(batch_size: int) -> list[dict]:
+    """
+    Returns the image files to process: the pending uploads to convert
+    and the converted images without renditions (uploaded before the renditions were introduced).
+    A file shared by several rows is returned once.
+    """
+
+    pending_images = []
+    for image_model in IMAGE_MODELS:
+        model, image_field, status_field, renditions_field = image_model.values()
+        images = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True}).order_by(image_field)
+
+        selections = [(images.filter(**{status_field: IMAGE_STATUS_PENDING}), True)]
+        if renditions_field:
+            ready_images = images.filter(**{status_field: IMAGE_STATUS_READY, renditions_field: {}})
+            failed_names = [name for failed_model, name in failed_renditions if failed_model is model]
+            if failed_names:
+                ready_images = ready_images.exclude(**{f'{image_field}__in': failed_names})
+            selections.append((ready_images, False))
+
+        for selection, convert in selections:
+            names = selection.values_list(image_field, flat=True).distinct()[:batch_size - len(pending_images)]
+            pending_images += [{**image_model, 'name': name, 'convert': convert} for name in names]
+            if len(pending_images) >= batch_size:
+                return pending_images
+
+    return pending_images
+
+
+def saveFile(storage, name: str, content: bytes) -> str:
+    "Saves the file under its deterministic name, replacing the previous one."
+
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(content))
+
+
+def saveProcessedImage(pending_image: dict, result: dict | None) -> bool:
+    """
+    Saves the converted image and its renditions and marks the rows sharing the image ready,
+    or marks them failed without `result`. A ready image whose renditions failed is left as it is.
+
+    Only the rows still holding the same image in the same status are changed, otherwise the result is discarded.
+    The rows are saved, so the signals invalidate their dependents.
+    """
+
+    image_field, status_field, renditions_field = (
+        pending_image['image_field'], pending_image['status_field'], pending_image['renditions_field']
+    )
+    raw_name = pending_image['name']
+    expected_status = IMAGE_STATUS_PENDING if pending_image['convert'] else IMAGE_STATUS_READY
+
+    if result is None and not pending_image['convert']:
+        failed_renditions.add((pending_image['model'], raw_name))
+        return False
+
+    with transaction.atomic():
+        instances = list(
+            pending_image['model'].objects
+            .select_for_update()
+            .filter(**{status_field: expected_status, image_field: raw_name})
+            .order_by('pk')
+        )
+        if not instances:
+            return False
+
+        storage = getattr(instances[0], image_field).storage
+        update_fields = [status_field]
+        if result is None:
+            values = {status_field: IMAGE_STATUS_FAILED}
+        else:
+            image_name = raw_name
+            if result['image'] is not None:
+                image_name = saveFile(storage, os.path.splitext(raw_name)[0] + '.webp', result['image'])
+
+            values = {image_field: image_name, status_field: IMAGE_STATUS_READY}
+            update_fields.append(image_field)
+            if renditions_field:
+                renditions = {str(result['width']): image_name}
+                for width, rendition_bytes in result['renditions'].items():
+                    rendition_name = getImageRenditionLocation(image_name, width)
+                    renditions[str(width)] = saveFile(storage, rendition_name, rendition_bytes)
+                values[renditions_field] = renditions
+                update_fields.append(renditions_field)
+
+        for instance in instances:
+            for field, value in values.items():
+                setattr(instance, field, value)
+            instance.save(update_fields=update_fields)
+
+    # A row deduplicated from the raw image meanwhile keeps it until the next batch converts it
+    if result is not None and image_name != raw_name:
+        deleteUnreferencedFiles(pending_image, storage, raw_name, {raw_name})
+    return True
+
+
+def getImageFiles(instance, image_model: dict) -> set[str]:
+    "Returns the names of the image files of the instance, its renditions included."
+
+    image_name = getattr(instance, image_model['image_field']).name
+    if not image_name:
+        return set()
+
+    files = {image_name}
+    if image_model['renditions_field']:
+        files.update(getattr(instance, image_model['renditions_field']).values())
+    return files
+
+
+def getImageModel(model) -> dict:
+    return next(image_model for image_model in IMAGE_MODELS if image_model['model'] is model)
+
+
+def deleteUnreferencedFiles(image_model: dict, storage, image_name: str, files: set[str]) -> bool:
+    """
+    Deletes the files of the image once no row refers to `image_name`.
+
+    The rows referring to it are locked: `deduplicateImage` locks the row it reuses the image of,
+    so the check waits for a row being pointed at the same files to be committed.
+    Returns whether the files were deleted.
+    """
+
+    image_field = image_model['image_field']
+    with transaction.atomic():
+        referring_rows = image_model['model'].objects.select_for_update().filter(**{image_field: image_name})
+        if referring_rows.exists():
+            return False
+
+        for name in files:
+            storage.delete(name)
+    return True
+
+
+def releaseImageFiles(instance) -> None:
+    """
+    Deletes the image files of the deleted instance once no other row refers to them.
+    The check runs after the commit, so the files of a rolled back deletion are kept.
+    """
+
+    image_model = getImageModel(type(instance))
+    files = getImageFiles(instance, image_model)
+    if not files:
+        return
+
+    image_file = getattr(instance, image_model['image_field'])
+    image_name, storage = image_file.name, image_file.storage
+    transaction.on_commit(lambda: deleteUnreferencedFiles(image_model, storage, image_name, files))
+
+
+def releaseReplacedImage(instance, previous_image_name: str) -> None:
+    "Deletes the replaced image file of the instance after the commit once no other row refers to it."
+
+    image_model = getImageModel(type(instance))
+    storage = getattr(instance, image_model['image_field']).storage
+    transaction.on_commit(
+        lambda: deleteUnreferencedFiles(image_model, storage, previous_image_name, {previous_image_name})
+    )
+
+
+def processPendingImages(batch_size: int = 20, executor: Executor = None) -> int:
+    """
+    Converts a batch of pending images to WEBP and makes their renditions
+    in the worker processes of `executor`.
+
+    The conversion runs outside of any database transaction.
+    Returns the number of processed images.
+    """
+
+    pending_images = getPendingImages(batch_size)
+    if not pending_images:
+        return 0
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor()
+
+    try:
+        futures = []
+        for pending_image in pending_images:
+            storage = pending_image['model']._meta.get_field(pending_image['image_field']).storage
+            try:
+                with storage.open(pending_image['name'], 'rb') as file:
+                    image_bytes = file.read()
+            except OSError as e:
+                futures.append(e)
+                continue
+
+            rendition_widths = RENDITION_WIDTHS if pending_image['renditions_field'] else ()
+            futures.append(executor.submit(processImage, image_bytes, pending_image['convert'], rendition_widths))
+
+        processed_count = 0
+        for pending_image, future in zip(pending_images, futures):
+            try:
+                if isinstance(future, OSError):
+                    raise future
+                result = future.result()
+            except Exception as e:
+                logs.addLog(
+                    level='warning',
+                    message=f"{pending_image['model'].__name__} image {pending_image['name']} processing failed.",
+                    details=str(e)
+                )
+                result = None
+
+            processed_count += saveProcessedImage(pending_image, result)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return processed_count
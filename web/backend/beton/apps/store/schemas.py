@@ -1,6 +1,27 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PositiveInt
+
+import uuid
+from datetime import datetime
 
 
 class ProductListOffsetScheme(BaseModel):
     start: int
     end: int
+
+
+class ProductListCursorScheme(BaseModel):
+    id: int
+
+
+class OrderListCursorScheme(BaseModel):
+    created_at: datetime
+    id: uuid.UUID
+
+
+class OrderItemScheme(BaseModel):
+    id: int
+    quantity: PositiveInt
+
+
+class OrderCartScheme(BaseModel):
+    items: list[OrderItemScheme] = Field(min_length=1)
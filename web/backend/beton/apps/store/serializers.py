@@ -1,20 +1,100 @@
 from rest_framework import serializers
 
-from apps.store.models import Category, Product, ProductVariant, Order, OrderItem
+from django.db.models import QuerySet, Prefetch
+from django.http import QueryDict
+from django.core.exceptions import FieldDoesNotExist
+
+from apps.store.models import (
+    Category, 
+    Product, 
+    ProductVariant, 
+    ProductVariantImage, 
+    Order, 
+    OrderItem, 
+    IMAGE_STATUS_READY
+)
+
+
+class ProjectionError(ValueError):
+    """Raised on invalid `fields` or `view` query parameters."""
+
+
+class ProjectionSerializerMixin:
+    """
+    Serializes only the requested subset of fields.
+
+    The subset is requested by the `fields` query parameter (comma separated names)
+    or by the name of one of the predefined `views`.
+    """
+
+    views: dict[str, list[str]] = {}
+
+    def __init__(self, *args, fields: list[str] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    @classmethod
+    def getRequestedFields(cls, query_params: QueryDict) -> list[str] | None:
+        "Returns the fields requested by the query parameters, `None` for all the fields."
+
+        view = query_params.get('view')
+        fields = query_params.get('fields')
+        if view and fields:
+            raise ProjectionError('Only one of fields and view may be passed')
+
+        if view:
+            if view not in cls.views:
+                raise ProjectionError(f"View must be one of: {', '.join(cls.views)}")
+            return cls.views[view]
+
+        if fields:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+            unknown_fields = [field for field in fields if field not in cls.Meta.fields]
+            if unknown_fields:
+                raise ProjectionError(f"Unknown fields: {', '.join(unknown_fields)}")
+            return fields
+
+        return None
+
+    @classmethod
+    def getColumns(cls, fields: list[str]) -> list[str]:
+        "Returns the model columns of the fields for `QuerySet.only`, the relations are left out."
+
+        columns = ['pk']
+        for field in fields:
+            try:
+                model_field = cls.Meta.model._meta.get_field(field)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.append(field)
+        return columns
 
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ['id', 'slug', 'title', 'description', 'image']
-        read_only_fields = ['id', 'slug']
+        fields = ['id', 'slug', 'title', 'description', 'image', 'updated_at']
+        read_only_fields = ['id', 'slug', 'updated_at']
+
+    def to_representation(self, category: Category) -> dict:
+        "The image is shown once it is converted."
+
+        data = super().to_representation(category)
+        if category.image_status != IMAGE_STATUS_READY:
+            data['image'] = None
+        return data
+
 
+class ProductSerializer(ProjectionSerializerMixin, serializers.ModelSerializer):
+    views = {'summary': ['id', 'slug', 'title']}
 
-class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'slug', 'title', 'description', 'category']
-        read_only_fields = ['id', 'slug']
+        fields = ['id', 'slug', 'title', 'description', 'category', 'updated_at']
+        read_only_fields = ['id', 'slug', 'updated_at']
         
         
 class ProductVariantSerializer(serializers.ModelSerializer):
@@ -27,8 +107,71 @@ class ProductVariantSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProductVariant
-        fields = ['id', 'slug', 'base_product', 'base_product_id', 'title', 'configuration', 'price', 'stock']
-        read_only_fields = ['id', 'slug']
+        fields = [
+            'id', 'slug', 'base_product', 'base_product_id', 
+            'title', 'configuration', 'price', 'stock', 'updated_at'
+        ]
+        read_only_fields = ['id', 'slug', 'updated_at']
+
+
+class ProductVariantListSerializer(ProductVariantSerializer):
+    images = serializers.SerializerMethodField()
+    image_renditions = serializers.SerializerMethodField()
+
+    class Meta(ProductVariantSerializer.Meta):
+        fields = ProductVariantSerializer.Meta.fields + ['images', 'image_renditions']
+
+    def get_images(self, variant: ProductVariant) -> list[str]:
+        return [str(image.image) for image in variant.images.all()]
+
+    def get_image_renditions(self, variant: ProductVariant) -> list[dict]:
+        "Widths and paths of the images copies for `srcset`, in the order of `images`."
+
+        return [image.renditions for image in variant.images.all()]
+
+    @staticmethod
+    def setupEagerLoading(queryset: QuerySet) -> QuerySet:
+        "Joins the base products with their categories and loads the images ordered by id in one extra query."
+
+        images = ProductVariantImage.objects.filter(status=IMAGE_STATUS_READY).order_by('id')
+        return queryset.select_related('base_product__category').prefetch_related(Prefetch('images', queryset=images))
+
+
+class ProductDocumentVariantSerializer(serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
+    image_renditions = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductVariant
+        fields = ['id', 'slug', 'title', 'configuration', 'price', 'stock', 'images', 'image_renditions', 'updated_at']
+
+    def get_images(self, variant: ProductVariant) -> list[str]:
+        return [image.image.url for image in variant.images.all() if image.image]
+
+    def get_image_renditions(self, variant: ProductVariant) -> list[dict]:
+        "Widths and urls of the images copies for `srcset`, in the order of `images`."
+
+        return [
+            {width: image.image.storage.url(path) for width, path in image.renditions.items()}
+            for image in variant.images.all() if image.image
+        ]
+
+
+class ProductDocumentSerializer(serializers.ModelSerializer):
+    category = CategorySerializer(read_only=True)
+    variants = ProductDocumentVariantSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'slug', 'title', 'description', 'category', 'variants', 'updated_at']
+
+    @staticmethod
+    def setupEagerLoading(queryset: QuerySet) -> QuerySet:
+        "Loads the category, the variants and their images in two extra queries."
+
+        images = ProductVariantImage.objects.filter(status=IMAGE_STATUS_READY).order_by('id')
+        variants = ProductVariant.objects.order_by('id').prefetch_related(Prefetch('images', queryset=images))
+        return queryset.select_related('category').prefetch_related(Prefetch('variants', queryset=variants))
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -40,7 +183,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ProjectionSerializerMixin, serializers.ModelSerializer):
+    views = {'summary': ['id', 'fullname', 'status', 'created_at']}
+
     items = OrderItemSerializer(
         source='orderitem_set',
         many=True,
@@ -56,4 +201,9 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
 
+    @staticmethod
+    def setupEagerLoading(queryset: QuerySet) -> QuerySet:
+        "Loads the nested items, their variants and base products in one extra query."
 
+        items = OrderItem.objects.select_related('product__base_product')
+        return queryset.prefetch_related(Prefetch('orderitem_set', queryset=items))
@@ -1,62 +1,115 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from django.db import transaction
 
-from config import project_settings
-from api.telegram import TelegramAPI
-
-from apps.store.models import Order
-from apps.store.utils import formatPrice
+from apps.store.models import Category, Product, ProductVariant, ProductVariantImage, Order, OrderItem
+from apps.store.notifications import createOrderNotifications
+from apps.store.caching import invalidateNamespaces
+from apps.store.documents import scheduleProductDocumentsRebuild
+from apps.store.processing import releaseImageFiles, releaseReplacedImage
+from apps.store.changes import recordOrderChange
 
 
 @receiver(post_save, sender=Order)
 def OrderPostSaveHandler(sender, instance, created, **kwargs):
-    "Sends a notification to the telegram bot about the order creation."
+    """
+    Adds notifications about the order creation to the outbox.
+    They are sent to the telegram bot by the `sendordernotifications` worker.
+    """
 
     if not created:
         return
 
-    def processAfterTransactionCommit():
-        order_cart_products = []
-        cart_total_price = 0
-        for i, order_item in enumerate(instance.orderitem_set.all()):
-            product = order_item.product
-            quantity = order_item.quantity
-            total_price = product.price * quantity
-            cart_total_price += total_price
-            configuration = ', '.join(f"{k}: {v}" for k, v in product.configuration.items())
-            order_cart_products.append(
-                f'*{i+1}.* '
-                f'{product.title} ({configuration}) [{quantity} шт.] — '
-                f'*{formatPrice(total_price)}* ({formatPrice(product.price)} / шт.)'
-            )
-        order_cart = '\n\n'.join(order_cart_products)
-
-        message_text = (
-            '*🔔 Получен новый заказ*\n\n'
-
-            f'🤵🏼 Заказчик: *{instance.fullname}*\n'
-            f'📞 Номер телефона: `{instance.contact}`\n'
-            f'📲 Способ связи: *{instance.contact_method}*\n\n'
-
-            '*🛒 Состав заказа:*\n'
-            f'{order_cart}\n\n'
-            
-            f'💰 Сумма заказа: *{formatPrice(cart_total_price)}*'
-        )
+    createOrderNotifications(instance)
+
+
+CATALOG_MODELS_NAMESPACES = {
+    Category: 'category',
+    Product: 'product',
+    ProductVariant: 'variant',
+    ProductVariantImage: 'variant_image',
+}
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductVariantImage)
+@receiver(post_delete, sender=ProductVariantImage)
+def CatalogChangeHandler(sender, instance, **kwargs):
+    "Invalidates the cached catalog responses depending on the changed model."
+
+    invalidateNamespaces(CATALOG_MODELS_NAMESPACES[sender])
+
+
+def getDocumentsProductIDs(sender, instance) -> list[int]:
+    "Returns the ids of the products whose documents include the changed instance."
+
+    if sender is Category:
+        return list(instance.products.values_list('id', flat=True))
+    if sender is Product:
+        return [instance.id]
+    if sender is ProductVariant:
+        return [instance.base_product_id]
+    if sender is ProductVariantImage:
+        variants = ProductVariant.objects.filter(id=instance.product_variant_id)
+        return list(variants.values_list('base_product_id', flat=True))
+    return []
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductVariantImage)
+@receiver(post_delete, sender=ProductVariantImage)
+def ProductDocumentChangeHandler(sender, instance, **kwargs):
+    """
+    Rebuilds the documents of the products affected by the change.
+    The deleted products and categories take their documents with them by the cascade.
+    """
 
-        telegram_api = TelegramAPI(bot_token=project_settings.TELEGRAM_ORDERS_BOT_TOKEN)
-        for user_id in project_settings.TELEGRAM_ORDERS_BOT_USERS:
-            telegram_api.sendRequest(
-                request_method='POST',
-                api_method='sendMessage',
-                parameters={
-                    'chat_id': user_id,
-                    'text': message_text,
-                    'parse_mode': 'Markdown'
-                }
-            )
+    product_ids = getDocumentsProductIDs(sender, instance)
+    if product_ids:
+        scheduleProductDocumentsRebuild(product_ids)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def OrderChangeHandler(sender, instance, **kwargs):
+    "Changes the validators of the order responses and adds the order to the change feed."
+
+    invalidateNamespaces('order')
+    recordOrderChange(instance.id if sender is Order else instance.order_id)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=ProductVariantImage)
+def ImageDeleteHandler(sender, instance, **kwargs):
+    "Deletes the image files no longer referred to by any row."
+
+    releaseImageFiles(instance)
+
+
+@receiver(pre_save, sender=Category)
+def CategoryImagePreSaveHandler(sender, instance, **kwargs):
+    "Remembers the stored image of the category to release it if it is replaced."
+
+    instance.previous_image_name = None
+    if instance.pk:
+        instance.previous_image_name = (
+            Category.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+        )
 
-    transaction.on_commit(processAfterTransactionCommit)
 
+@receiver(post_save, sender=Category)
+def CategoryImagePostSaveHandler(sender, instance, **kwargs):
+    "Releases the replaced or cleared image of the category."
 
+    previous_image_name = instance.previous_image_name
+    if previous_image_name and previous_image_name != instance.image.name:
+        releaseReplacedImage(instance, previous_image_name)
@@ -1,13 +1,35 @@
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
 
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils.text import slugify
+from django.utils.http import http_date, parse_http_date
+from django.db import connection
+from django.conf import settings
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
 
 from apps.auth.models import User, AuthToken
-from apps.auth.utils import hashAuthToken
-from apps.store.models import Category, Product, ProductVariant, Order
+from apps.auth.utils import hashAuthToken, makeAuthToken
+from apps.auth.access import getAuthTokenRecord
+from apps.auth import caching as auth_caching
+from apps.store.models import (
+    Category, 
+    Product, 
+    ProductVariant, 
+    ProductVariantImage, 
+    Order, 
+    OrderItem, 
+    OrderNotification, 
+    ProductDocumentRebuild
+)
+from apps.store.notifications import processOrderNotifications
+from apps.store.processing import processPendingImages
+from apps.store.documents import processProductDocumentRebuilds
 from apps.store.serializers import (
     CategorySerializer, 
     ProductSerializer, 
@@ -15,19 +37,53 @@ from apps.store.serializers import (
     OrderSerializer
 )
 
+from beton.renderers import FastJSONRenderer, FastJSONParser
+from beton.ratelimit import RateLimitPolicies, SlidingWindowRateLimiter, TokenBucketRateLimiter, LocalRateLimiter
+from beton.views import serveMedia
+
+from utils import makeResponseData, getClientIP
+from cache import Cache, CircuitBreaker, CircuitOpenError
+from config import project_settings
+from api.telegram import TelegramAPI, AsyncTelegramAPI, aiohttp
+import logs
+
+import os
+import redis
+import random
+import asyncio
+import unittest
+import json
 import uuid
-from io import BytesIO
+import time
+import queue
+import logging
+import tempfile
+from io import BytesIO, StringIO
+from decimal import Decimal
+from datetime import datetime, date, timedelta, timezone
 from PIL import Image
+from unittest import mock
+from logging.handlers import QueueHandler
+from concurrent.futures import ProcessPoolExecutor
 
 
-def getTestImage():
+def getTestImage(size: tuple = (100, 100), color: tuple = (0, 0, 0)):
     bts = BytesIO()
-    img = Image.new("RGB", (100, 100))
+    img = Image.new("RGB", size, color)
     img.save(bts, 'jpeg')
     image_id = uuid.uuid4()
     return SimpleUploadedFile(f"test-{image_id}.jpg", bts.getvalue())
 
 
+def readLogFiles(directory: str) -> str:
+    log_text = ''
+    for path, _, filenames in os.walk(directory):
+        for filename in filenames:
+            with open(os.path.join(path, filename), encoding='utf-8') as file:
+                log_text += file.read()
+    return log_text
+
+
 class CategoryTests(APITestCase):
     def testCategoryCreation(self):
         url = reverse('category_list')
@@ -127,6 +183,74 @@ class CategoryTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
    
         
+    def testCategoryListConditionalRequest(self):
+        Category.objects.create(title='Stairs')
+        url = reverse('category_list')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        etag = response['ETag']
+
+        # The unchanged list isn't sent again
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        # A change later in the same second would have the same `Last-Modified`, so it isn't trusted
+        last_modified = parse_http_date(response['Last-Modified'])
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(last_modified))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(last_modified + 1))
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # The change gives a new ETag
+        Category.objects.create(title='Vases')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['details']['categories']), 2)
+
+    def testCategoryDetailAnyETag(self):
+        Category.objects.create(title='Stairs')
+
+        # `*` only matches a category that exists
+        url = reverse('category_detail', kwargs={'category_slug': 'stairs'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('ETag', response)
+
+        url = reverse('category_detail', kwargs={'category_slug': 'missing'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def testCategoryImageReplacement(self):
+        color = tuple(random.randrange(256) for _ in range(3))
+        category = Category.objects.create(title='Blocks', image=getTestImage(color=color))
+        image_path = category.image.path
+        self.assertEqual(category.image_status, 'pending')
+
+        # The cleared image is released and its hash is reset
+        category.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+        self.assertEqual(category.image_hash, '')
+        self.assertFalse(os.path.exists(image_path))
+
+        # The same content is stored again instead of being reused from the cleared category
+        other_category = Category.objects.create(title='Tiles', image=getTestImage(color=color))
+        self.assertTrue(other_category.image.name)
+        self.assertTrue(os.path.exists(other_category.image.path))
+
+        # A file shared with another category is kept when one of them replaces it
+        category.image = getTestImage(color=color)
+        category.save()
+        self.assertEqual(category.image.name, other_category.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            category.image = getTestImage(color=tuple(255 - value for value in color))
+            category.save()
+        self.assertTrue(os.path.exists(other_category.image.path))
+
 
 class ProductTests(APITestCase):
     def testProductCreation(self):
@@ -240,6 +364,59 @@ class ProductTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+    def testProductListPagination(self):
+        category = Category.objects.create(title='Garden')
+        Product.objects.bulk_create([
+            Product(slug=f'product-{product_index}', title=f'Test product {product_index}', category=category)
+            for product_index in range(12)
+        ])
+        url = reverse('product_list')
+
+        # Cursor pagination
+        products_ids = []
+        query_params = {'limit': 5, 'count': 'exact'}
+        while True:
+            response = self.client.get(url, query_params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            details = response.json()['details']
+            self.assertEqual(details['products_count'], 12)
+            products_ids += [product['id'] for product in details['products']]
+            if not details['next_cursor']:
+                break
+            query_params = {'limit': 5, 'cursor': details['next_cursor'], 'count': 'exact'}
+
+        self.assertEqual(products_ids, sorted(Product.objects.values_list('id', flat=True)))
+
+        # Invalid cursor
+        response = self.client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Offset pagination compatibility mode
+        response = self.client.get(url, {'offset': '{"start": 10, "end": 15}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        details = response.json()['details']
+        self.assertEqual(details['products_count'], 12)
+        self.assertEqual([product['id'] for product in details['products']], products_ids[10:])
+
+    def testProductResponseCache(self):
+        product = Product.objects.create(title='Concrete vase')
+        url = reverse('product_detail', kwargs={'product_slug': product.slug})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The repeated request is served from the cache
+        with CaptureQueriesContext(connection) as queries:
+            cached_response = self.client.get(url)
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        self.assertEqual(cached_response.json(), response.json())
+
+        # The change invalidates the cached response
+        product.description = 'Handmade'
+        product.save()
+        response = self.client.get(url)
+        self.assertEqual(response.json()['details']['product']['description'], 'Handmade')
+
 
 class ProductVariantTests(APITestCase):
     def testProductVariantCreation(self):
@@ -374,6 +551,171 @@ class ProductVariantTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+    def testProductDocument(self):
+        category = Category.objects.create(title='Planters')
+        product = Product.objects.create(title='Flowerpot', category=category)
+        variant = ProductVariant.objects.create(base_product=product, title='Flowerpot XXL', price=500, stock=3)
+        url = reverse('product_document_detail', kwargs={'product_slug': product.slug})
+
+        # The missing document is built on the first request
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        document = response.json()['details']['product']
+        self.assertEqual(document['category']['slug'], category.slug)
+        self.assertEqual([variant['slug'] for variant in document['variants']], [variant.slug])
+
+        # The changes queue the rebuild for the worker
+        ProductVariantImage.objects.create(product_variant=variant, image=getTestImage(), status='ready')
+        variant.price = 450
+        variant.save()
+        self.assertEqual(processProductDocumentRebuilds(), 1)
+        self.assertFalse(ProductDocumentRebuild.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 1)
+
+        document = response.json()['details']['product']
+        self.assertEqual(document['variants'][0]['price'], '450.00')
+        self.assertEqual(len(document['variants'][0]['images']), 1)
+
+        # The full build doesn't touch the queue
+        ProductDocumentRebuild.objects.create(product_id=product.id)
+        output = StringIO()
+        call_command('rebuildproductdocuments', '--all', stdout=output)
+        self.assertEqual(output.getvalue().strip(), 'Built 1 product documents.')
+        self.assertTrue(ProductDocumentRebuild.objects.exists())
+
+        response = self.client.get(reverse('product_document_detail', kwargs={'product_slug': 'missing'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def testProductVariantListQueriesCount(self):
+        product = Product.objects.create(title='Flowerpots')
+        images = []
+        for i in range(3):
+            variant = ProductVariant.objects.create(base_product=product, title=f'Flowerpot {i}', price=100, stock=1)
+            for j in range(2):
+                image = ProductVariantImage.objects.create(
+                    product_variant=variant, image=getTestImage(), status='ready'
+                )
+                images.append(str(image.image))
+
+        url = reverse('product_variant_list', kwargs={'product_slug': product.slug})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The variants with their base products and the images
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 2)
+
+        variants = response.json()['details']['variants']
+        self.assertEqual([variant['title'] for variant in variants], ['Flowerpot 0', 'Flowerpot 1', 'Flowerpot 2'])
+        self.assertEqual([variant['base_product']['id'] for variant in variants], [product.id] * 3)
+        self.assertEqual(sum((variant['images'] for variant in variants), []), images)
+
+    def testProductVariantImagesProcessing(self):
+        product = Product.objects.create(title='Flowerpots')
+        variant = ProductVariant.objects.create(base_product=product, title='Flowerpot', price=100, stock=1)
+        image = ProductVariantImage.objects.create(product_variant=variant, image=getTestImage())
+        raw_image_path = image.image.path
+        self.assertEqual(image.status, 'pending')
+
+        # The pending image isn't listed
+        url = reverse('product_variant_list', kwargs={'product_slug': product.slug})
+        response = self.client.get(url)
+        self.assertEqual(response.json()['details']['variants'][0]['images'], [])
+
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(processPendingImages(executor=executor), 1)
+
+        image.refresh_from_db()
+        self.assertEqual(image.status, 'ready')
+        self.assertTrue(image.image.name.endswith('.webp'))
+        self.assertFalse(os.path.exists(raw_image_path))
+        with Image.open(image.image.path) as webp_image:
+            self.assertEqual(webp_image.format, 'WEBP')
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()['details']['variants'][0]['images'], [image.image.name])
+
+    def testProductVariantImageRenditions(self):
+        product = Product.objects.create(title='Flowerpots')
+        variant = ProductVariant.objects.create(base_product=product, title='Flowerpot', price=100, stock=1)
+        image = ProductVariantImage.objects.create(product_variant=variant, image=getTestImage((1000, 500)))
+        # Converted before the renditions were introduced
+        old_image = ProductVariantImage.objects.create(product_variant=variant, image=getTestImage(), status='ready')
+
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(processPendingImages(executor=executor), 2)
+
+        image.refresh_from_db()
+        stem = os.path.splitext(image.image.name)[0]
+        self.assertEqual(image.renditions, {
+            '1000': image.image.name,
+            '320': f'{stem}-320w.webp',
+            '640': f'{stem}-640w.webp',
+        })
+        with Image.open(image.image.storage.path(image.renditions['320'])) as rendition:
+            self.assertEqual(rendition.size, (320, 160))
+
+        old_image.refresh_from_db()
+        self.assertEqual(old_image.renditions, {'100': old_image.image.name})
+
+        url = reverse('product_variant_list', kwargs={'product_slug': product.slug})
+        response = self.client.get(url)
+        self.assertEqual(
+            response.json()['details']['variants'][0]['image_renditions'], 
+            [image.renditions, old_image.renditions]
+        )
+
+    def testProductVariantImageRenditionsFailure(self):
+        product = Product.objects.create(title='Flowerpots')
+        variant = ProductVariant.objects.create(base_product=product, title='Flowerpot', price=100, stock=1)
+        broken_file = SimpleUploadedFile(f'test-{uuid.uuid4()}.webp', b'not an image')
+        image = ProductVariantImage.objects.create(product_variant=variant, image=broken_file, status='ready')
+
+        # The listed image isn't hidden by the failed renditions and isn't retried by every batch
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(processPendingImages(executor=executor), 0)
+            self.assertEqual(processPendingImages(executor=executor), 0)
+        image.refresh_from_db()
+        self.assertEqual((image.status, image.renditions), ('ready', {}))
+
+    def testProductVariantImageDeduplication(self):
+        product = Product.objects.create(title='Blocks')
+        red_block = ProductVariant.objects.create(base_product=product, title='Red block', price=100, stock=1)
+        grey_block = ProductVariant.objects.create(base_product=product, title='Grey block', price=100, stock=1)
+        color = tuple(random.randrange(256) for _ in range(3))
+
+        image = ProductVariantImage.objects.create(product_variant=red_block, image=getTestImage((500, 500), color))
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(processPendingImages(executor=executor), 1)
+        image.refresh_from_db()
+        content_hash = image.content_hash
+        self.assertEqual(image.image.name, f'store/images/products/{content_hash[:2]}/{content_hash}.webp')
+
+        # The same photo is not stored again, its converted image and renditions are reused
+        duplicate = ProductVariantImage.objects.create(product_variant=grey_block, image=getTestImage((500, 500), color))
+        self.assertEqual(
+            (duplicate.image.name, duplicate.status, duplicate.renditions), 
+            (image.image.name, 'ready', image.renditions)
+        )
+
+        # The media route is registered only in development
+        response = serveMedia(RequestFactory().get('/'), image.image.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+
+        files = [image.image.path] + [image.image.storage.path(name) for name in image.renditions.values()]
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertTrue(all(os.path.exists(path) for path in files))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            duplicate.delete()
+        self.assertFalse(any(os.path.exists(path) for path in files))
+
 
 class OrderTests(APITestCase):
     def testOrderCreation(self):
@@ -397,7 +739,7 @@ class OrderTests(APITestCase):
                     title=f'Test variant {variant_id}',
                     configuration={'size': 10, 'color': 'white'},
                     price=(1000 * variant_index),
-                    stock=(5 * variant_index)
+                    stock=(5 * (variant_index + 1))
                 ))
         products = Product.objects.bulk_create(products_to_create)
         variants = ProductVariant.objects.bulk_create(variants_to_create)
@@ -413,6 +755,48 @@ class OrderTests(APITestCase):
         response = self.client.post(url, data, format='json') 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+        # Ordered quantities are taken from the stock
+        for variant in variants:
+            stock = ProductVariant.objects.get(id=variant.id).stock
+            self.assertEqual(stock, variant.stock - 5)
+
+
+    def testOrderCreationStockValidation(self):
+        category = Category.objects.create(title='Home')
+        product = Product.objects.create(slug='product', title='Test product', category=category)
+        variant = ProductVariant.objects.create(
+            base_product=product, 
+            title='Test variant',
+            configuration={'size': 10, 'color': 'white'},
+            price=1000,
+            stock=3
+        )
+        url = reverse('order_list')
+
+        data = {
+            'items': [{'id': variant.id, 'quantity': 2}, {'id': variant.id, 'quantity': 2}],
+            'fullname': 'Nikita Silaev',
+            'contact': '+7 999 888 77 66',
+            'contact_method': 'phone'
+        }
+
+        # Oversell of the merged cart lines
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # Unknown product variant
+        data['items'] = [{'id': variant.id + 1, 'quantity': 1}]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Body that isn't an object
+        for body in ([data], 'order', 1):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(ProductVariant.objects.get(id=variant.id).stock, 3)
+        self.assertFalse(Order.objects.exists())
+
 
     def testOrderEditing(self):
         category = Category.objects.create(title='Home')
@@ -532,3 +916,615 @@ class OrderTests(APITestCase):
         # Try to get deleted product
         response = self.client.get(url, format='json')     
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def testOrderListQueriesCount(self):
+        category = Category.objects.create(title='Home')
+        product = Product.objects.create(slug='product', title='Test product', category=category)
+        variants = ProductVariant.objects.bulk_create([
+            ProductVariant(
+                base_product=product, 
+                slug=f'variant-{variant_index}', 
+                title=f'Test variant {variant_index}',
+                configuration={'size': 10, 'color': 'white'},
+                price=1000,
+                stock=10
+            )
+            for variant_index in range(3)
+        ])
+
+        def createOrders(orders_count: int) -> None:
+            for order_index in range(orders_count):
+                order = Order.objects.create(
+                    fullname='Nikita Silaev', 
+                    contact='+7 999 888 77 66', 
+                    contact_method='phone'
+                )
+                OrderItem.objects.bulk_create(
+                    [OrderItem(order=order, product=variant, quantity=2) for variant in variants]
+                )
+
+        def getOrdersQueriesCount() -> int:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('order_list'), format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        createOrders(1)
+        single_order_queries_count = getOrdersQueriesCount()
+
+        createOrders(10)
+        many_orders_queries_count = getOrdersQueriesCount()
+
+        self.assertEqual(single_order_queries_count, many_orders_queries_count)
+
+    def testOrderListPagination(self):
+        for order_index in range(7):
+            Order.objects.create(
+                fullname=f'Customer {order_index}', 
+                contact='+7 999 888 77 66', 
+                contact_method='phone'
+            )
+        url = reverse('order_list')
+
+        orders_ids = []
+        query_params = {'limit': 3}
+        while True:
+            response = self.client.get(url, query_params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            details = response.json()['details']
+            orders_ids += [order['id'] for order in details['orders']]
+            if not details['next_cursor']:
+                break
+            query_params = {'limit': 3, 'cursor': details['next_cursor']}
+
+        expected_orders_ids = [
+            str(order_id) for order_id in Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        ]
+        self.assertEqual(orders_ids, expected_orders_ids)
+
+    def testOrderSummaryList(self):
+        for order_index in range(7):
+            Order.objects.create(
+                fullname=f'Customer {order_index}', 
+                contact='+7 999 888 77 66', 
+                contact_method='phone',
+                status='completed' if order_index % 3 == 0 else 'active'
+            )
+        url = reverse('order_summary_list')
+
+        response = self.client.get(url, {'status': 'active', 'limit': 3, 'count': 'exact'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        details = response.json()['details']
+        self.assertEqual(details['orders_count'], 4)
+        self.assertEqual(set(details['orders'][0]), {'id', 'fullname', 'status', 'created_at'})
+
+        response = self.client.get(url, {'status': 'active', 'limit': 3, 'cursor': details['next_cursor']})
+        next_details = response.json()['details']
+        self.assertIsNone(next_details['next_cursor'])
+
+        expected_orders_ids = [
+            str(order_id) for order_id in 
+            Order.objects.filter(status='active').order_by('-created_at', '-id').values_list('id', flat=True)
+        ]
+        orders_ids = [order['id'] for order in details['orders'] + next_details['orders']]
+        self.assertEqual(orders_ids, expected_orders_ids)
+
+    def testListsProjection(self):
+        product = Product.objects.create(title='Blocks', description='Concrete blocks')
+        variant = ProductVariant.objects.create(base_product=product, title='Grey block', price=100, stock=10)
+        for order_index in range(3):
+            order = Order.objects.create(
+                fullname=f'Customer {order_index}', 
+                contact='+7 999 888 77 66', 
+                contact_method='phone'
+            )
+            OrderItem.objects.create(order=order, product=variant, quantity=1)
+        url = reverse('order_list')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'view': 'summary'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        orders = response.json()['details']['orders']
+        self.assertEqual(set(orders[0]), {'id', 'fullname', 'status', 'created_at'})
+        # The items are not loaded and the other columns are not selected
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('contact', selects[0])
+
+        response = self.client.get(url, {'fields': 'id,items'})
+        orders = response.json()['details']['orders']
+        self.assertEqual(set(orders[0]), {'id', 'items'})
+        self.assertEqual(orders[0]['items'][0]['product']['id'], variant.id)
+
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'view': 'full'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse('product_list'), {'view': 'summary'})
+        self.assertEqual(response.json()['details']['products'], [
+            {'id': product.id, 'slug': product.slug, 'title': product.title}
+        ])
+
+    def testOrderChangeFeed(self):
+        url = reverse('order_change_list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        plain_auth_token, selector, auth_token_hash, auth_token_salt_hex = makeAuthToken()
+        user = User.objects.create(name='test_user')
+        AuthToken.objects.create(
+            user=user, selector=selector, token_hash=auth_token_hash, salt_hex=auth_token_salt_hex
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {plain_auth_token}')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        details = response.json()['details']
+        self.assertTrue(details['reset'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(fullname='Customer', contact='+7 999 888 77 66', contact_method='phone')
+
+        response = self.client.get(url, {'since': details['version']})
+        next_details = response.json()['details']
+        self.assertEqual(next_details['orders'], [str(order.id)])
+        self.assertFalse(next_details['reset'])
+        self.assertGreater(next_details['version'], details['version'])
+
+        response = self.client.get(url, {'since': next_details['version']})
+        self.assertEqual(response.json()['details']['orders'], [])
+
+        response = self.client.get(url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def testOrderNotificationsOutbox(self):
+        with mock.patch.object(project_settings, 'TELEGRAM_ORDERS_BOT_USERS', [1001, 1002]):
+            order = Order.objects.create(
+                fullname='Nikita Silaev', 
+                contact='+7 999 888 77 66', 
+                contact_method='phone'
+            )
+
+        # Notifications are written in the order transaction
+        notifications = OrderNotification.objects.filter(order=order)
+        self.assertEqual(
+            sorted(notifications.values_list('chat_id', flat=True)), 
+            ['1001', '1002']
+        )
+
+        # The first delivery fails and is postponed
+        with mock.patch.object(TelegramAPI, 'sendRequest', return_value={'code': 502, 'text': 'Bad Gateway'}):
+            self.assertEqual(processOrderNotifications(), 2)
+        self.assertEqual(notifications.filter(status='pending', attempts=1).count(), 2)
+        with mock.patch.object(TelegramAPI, 'sendRequest', return_value={'code': 200, 'text': 'OK'}):
+            self.assertEqual(processOrderNotifications(), 0)
+
+        # The retry succeeds
+        notifications.update(next_attempt_at=order.created_at)
+        with mock.patch.object(TelegramAPI, 'sendRequest', return_value={'code': 200, 'text': 'OK'}):
+            self.assertEqual(processOrderNotifications(), 2)
+        self.assertEqual(notifications.filter(status='sent', attempts=2).count(), 2)
+
+    def testTelegramLongRetryAfter(self):
+        # A long flood wait isn't slept through, the 429 response is returned for the outbox to reschedule
+        session = mock.Mock()
+        session.post.return_value = mock.Mock(status_code=429, text='{"parameters": {"retry_after": 30}}')
+        with mock.patch('api.telegram.getHTTPSession', return_value=session), mock.patch('api.telegram.time.sleep') as sleep:
+            response = TelegramAPI('token').sendRequest('POST', 'getMe')
+        self.assertEqual(response['code'], 429)
+        self.assertEqual(session.post.call_count, 1)
+        sleep.assert_not_called()
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def testAsyncTelegramMessages(self):
+        class Response:
+            def __init__(self, status: int, text: str) -> None:
+                self.status = status
+                self.body = text
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args) -> None:
+                pass
+
+            async def text(self) -> str:
+                return self.body
+
+        def post(url, json, timeout):
+            if json['chat_id'] == 2:
+                return Response(429, '{"parameters": {"retry_after": 30}}')
+            return Response(200, 'OK')
+
+        session = mock.Mock(closed=False)
+        session.post.side_effect = post
+
+        # The chats are sent to concurrently, a long flood wait is returned instead of slept through
+        responses = asyncio.run(AsyncTelegramAPI(str(uuid.uuid4()), session=session).sendMessages([1, 2, 3], 'Hi'))
+        self.assertEqual([response['code'] for response in responses], [200, 429, 200])
+        self.assertEqual(session.post.call_count, 3)
+
+
+class AuthTokenTests(APITestCase):
+    def testSelectorAuthToken(self):
+        data = {'title': 'Stairs decorations'}
+        serializer = CategorySerializer(data=data)
+        if serializer.is_valid(raise_exception=True):
+            serializer.save()
+
+        category_slug = slugify(data.get('title'), allow_unicode=True)
+        url = reverse('category_detail', kwargs={'category_slug': category_slug})
+
+        plain_auth_token, selector, auth_token_hash, auth_token_salt_hex = makeAuthToken()
+        user = User.objects.create(name='test_user')
+        auth_token = AuthToken.objects.create(
+            user=user, selector=selector, token_hash=auth_token_hash, salt_hex=auth_token_salt_hex
+        )
+        auth_header = f'Bearer {plain_auth_token}'
+
+        # Request with correct selector but incorrect verifier
+        response = self.client.patch(url, data, format='json', HTTP_AUTHORIZATION=auth_header + 'extra_chars')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        # Request with correct auth token
+        response = self.client.patch(url, data, format='json', HTTP_AUTHORIZATION=auth_header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Request with revoked auth token
+        auth_token.revoked = True
+        auth_token.save()
+        response = self.client.patch(url, data, format='json', HTTP_AUTHORIZATION=auth_header)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def testLegacyAuthTokenWithSeparator(self):
+        category = Category.objects.create(title='Fences')
+        url = reverse('category_detail', kwargs={'category_slug': category.slug})
+
+        # Issued before the selectors, the part before the dot isn't a selector of any record
+        plain_auth_token = f'{uuid.uuid4()}.{uuid.uuid4()}'
+        auth_token_hash, auth_token_salt_hex = hashAuthToken(plain_auth_token)
+        user = User.objects.create(name='test_user')
+        AuthToken.objects.create(user=user, token_hash=auth_token_hash, salt_hex=auth_token_salt_hex)
+
+        response = self.client.patch(url, {'description': 'Wooden'}, format='json', HTTP_AUTHORIZATION=f'Bearer {plain_auth_token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AuthTokenCacheTests(APITestCase):
+    def createAuthToken(self, expires_at: datetime = None) -> tuple[str, AuthToken]:
+        plain_auth_token, selector, auth_token_hash, auth_token_salt_hex = makeAuthToken()
+        user = User.objects.create(name=f'test_user_{selector}')
+        auth_token = AuthToken.objects.create(
+            user=user, selector=selector, token_hash=auth_token_hash, salt_hex=auth_token_salt_hex, expires_at=expires_at
+        )
+        return plain_auth_token, auth_token
+
+    def testCacheTiers(self):
+        plain_auth_token, auth_token = self.createAuthToken()
+        auth_caching.cacheAuthToken(plain_auth_token, getAuthTokenRecord(plain_auth_token))
+        digest = auth_caching.getTokenDigest(plain_auth_token)
+
+        # The local tier
+        self.assertEqual(auth_caching.local_cache.getValue(digest)['id'], auth_token.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(auth_caching.getCachedAuthToken(plain_auth_token)['id'], auth_token.id)
+
+        # The Redis tier, which fills the local one again
+        auth_caching.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(auth_caching.getCachedAuthToken(plain_auth_token)['id'], auth_token.id)
+        self.assertEqual(auth_caching.local_cache.getValue(digest)['id'], auth_token.id)
+
+    def testCacheExpireIsCappedByToken(self):
+        now = datetime.now(timezone.utc)
+        plain_auth_token, auth_token = self.createAuthToken(expires_at=now + timedelta(seconds=20))
+        auth_caching.cacheAuthToken(plain_auth_token, getAuthTokenRecord(plain_auth_token))
+
+        digest = auth_caching.getTokenDigest(plain_auth_token)
+        self.assertLessEqual(Cache().getKeyTTL(f'auth_tokens:{digest}'), 20)
+
+        # The expired token isn't cached
+        record = {'id': auth_token.id, 'expires_at': now - timedelta(seconds=1)}
+        auth_caching.cacheAuthToken('expired-token', record)
+        self.assertIsNone(auth_caching.getCachedAuthToken('expired-token'))
+
+    def testCacheEviction(self):
+        for change in ('revoke', 'delete'):
+            plain_auth_token, auth_token = self.createAuthToken()
+            auth_caching.cacheAuthToken(plain_auth_token, getAuthTokenRecord(plain_auth_token))
+            self.assertIsNotNone(auth_caching.getCachedAuthToken(plain_auth_token))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                if change == 'revoke':
+                    auth_token.revoked = True
+                    auth_token.save()
+                else:
+                    auth_token.delete()
+            self.assertIsNone(auth_caching.getCachedAuthToken(plain_auth_token))
+
+    def testCacheInvalidationMessage(self):
+        plain_auth_token, auth_token = self.createAuthToken()
+        auth_caching.cacheAuthToken(plain_auth_token, getAuthTokenRecord(plain_auth_token))
+        digest = auth_caching.getTokenDigest(plain_auth_token)
+
+        self.assertIsNotNone(auth_caching.local_cache.getValue(digest))
+
+        # An eviction published by another worker drops the local entry
+        Cache().publishMessage(auth_caching.AUTH_TOKENS_CHANNEL, str(auth_token.id))
+        for _ in range(50):
+            if auth_caching.local_cache.getValue(digest) is None:
+                break
+            time.sleep(0.05)
+        self.assertIsNone(auth_caching.local_cache.getValue(digest))
+
+
+class RateLimitTests(APITestCase):
+    def testPolicySelection(self):
+        policies = RateLimitPolicies(settings.RATE_LIMIT)
+        self.assertEqual(policies.getPolicyName('category_list', 'GET'), 'catalog_read')
+        self.assertEqual(policies.getPolicyName('order_list', 'POST'), 'order_write')
+
+        # The route of another method and the unknown routes get the default policy
+        self.assertEqual(policies.getPolicyName('order_list', 'GET'), 'default')
+        self.assertEqual(policies.getPolicyName(None, 'GET'), 'default')
+
+    def testSlidingWindowDelayLevels(self):
+        limiter = SlidingWindowRateLimiter(window=60, delay_levels=[
+            {'limit': 2, 'delay': 0},
+            {'limit': 4, 'delay': 0.25},
+            {'limit': 6, 'delay': 0.5},
+        ])
+        key = f'rate_limit:test:{uuid.uuid4().hex}'
+
+        def hit() -> bool:
+            return limiter.hit(key)['allowed']
+
+        # No delay below the first limit
+        self.assertEqual([hit(), hit()], [True, True])
+
+        # Then the requests must be at least 0.25 s apart, the rejected ones are counted too
+        self.assertFalse(hit())
+        time.sleep(0.3)
+        self.assertTrue(hit())
+
+        # Then 0.5 s apart
+        self.assertFalse(hit())
+        time.sleep(0.55)
+        self.assertTrue(hit())
+
+        # Beyond the last limit the requests are rejected until the oldest one leaves the window
+        decision = limiter.hit(key)
+        self.assertFalse(decision['allowed'])
+        self.assertEqual(decision['count'], 6)
+        self.assertGreater(decision['retry_after'], 55)
+
+    def testLocalRateLimiterSync(self):
+        limiter = LocalRateLimiter(
+            remote_limiter=SlidingWindowRateLimiter(window=60, delay_levels=[{'limit': 100, 'delay': 0}]),
+            local_limit=50,
+            sync_interval=60,
+            sync_batch_size=3,
+            max_keys=100,
+            failure_policy='open',
+            circuit_breaker=CircuitBreaker()
+        )
+        key = f'rate_limit:test:{uuid.uuid4().hex}'
+
+        # The first request of a client is checked by Redis, the next ones locally until the batch is full
+        sources = [limiter.hit(key)['source'] for _ in range(5)]
+        self.assertEqual(sources, ['redis', 'local', 'local', 'local', 'redis'])
+
+        # The pending hits are sent with the syncing request
+        self.assertEqual(Cache().redis_client.zcard(key), 5)
+
+    def testTokenBucketRateLimiter(self):
+        limiter = TokenBucketRateLimiter(capacity=3, refill_rate=1)
+        key = f'rate_limit:test:{uuid.uuid4().hex}'
+
+        decisions = [limiter.hit(key) for _ in range(4)]
+        self.assertEqual([decision['allowed'] for decision in decisions], [True, True, True, False])
+        self.assertEqual(decisions[-1]['retry_after'], 1)
+
+        # The hits allowed locally are taken from the bucket at once
+        key = f'rate_limit:test:{uuid.uuid4().hex}'
+        self.assertTrue(limiter.hit(key, hits=3)['allowed'])
+        self.assertFalse(limiter.hit(key)['allowed'])
+
+    def testCircuitBreaker(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        failing_call = mock.Mock(side_effect=redis.ConnectionError)
+
+        for _ in range(2):
+            with self.assertRaises(redis.ConnectionError):
+                circuit_breaker.call(failing_call)
+
+        # The open circuit doesn't call the service
+        with self.assertRaises(CircuitOpenError):
+            circuit_breaker.call(failing_call)
+        self.assertEqual(failing_call.call_count, 2)
+
+        # After the timeout a failed trial call opens the circuit again, a successful one closes it
+        now = time.monotonic()
+        with mock.patch('cache.time.monotonic', return_value=now + 11):
+            with self.assertRaises(redis.ConnectionError):
+                circuit_breaker.call(failing_call)
+            with self.assertRaises(CircuitOpenError):
+                circuit_breaker.call(failing_call)
+        with mock.patch('cache.time.monotonic', return_value=now + 22):
+            self.assertEqual(circuit_breaker.call(lambda: 'OK'), 'OK')
+        self.assertEqual(circuit_breaker.call(lambda: 'OK'), 'OK')
+
+    def testLocalRateLimiterFailurePolicies(self):
+        def makeLimiter(failure_policy: str) -> LocalRateLimiter:
+            return LocalRateLimiter(
+                remote_limiter=TokenBucketRateLimiter(capacity=3, refill_rate=1),
+                local_limit=0,
+                sync_interval=1,
+                sync_batch_size=10,
+                max_keys=100,
+                failure_policy=failure_policy,
+                circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10)
+            )
+
+        with mock.patch.object(redis.commands.core.Script, '__call__', side_effect=redis.ConnectionError):
+            # `open` counts the requests locally up to the limit
+            limiter = makeLimiter('open')
+            decisions = [limiter.hit('rate_limit:test:client') for _ in range(4)]
+            self.assertEqual([decision['allowed'] for decision in decisions], [True, True, True, False])
+            self.assertEqual({decision['source'] for decision in decisions}, {'fallback'})
+
+            # `closed` rejects them
+            decision = makeLimiter('closed').hit('rate_limit:test:client')
+            self.assertEqual((decision['allowed'], decision['source']), (False, 'unavailable'))
+
+    def testRateLimitUnavailableResponse(self):
+        rate_limit = {**settings.RATE_LIMIT, 'FAILURE_POLICY': 'closed'}
+        with (
+            override_settings(RATE_LIMIT=rate_limit),
+            mock.patch.object(redis.commands.core.Script, '__call__', side_effect=redis.ConnectionError)
+        ):
+            response = self.client.get(reverse('category_list'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @override_settings(TRUSTED_PROXIES=['127.0.0.1', '10.0.0.0/8'])
+    def testClientIP(self):
+        factory = RequestFactory()
+
+        request = factory.get('/', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(getClientIP(request), '203.0.113.5')
+
+        # The client is the nearest untrusted address of the chain
+        request = factory.get('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.5, 10.0.0.2')
+        self.assertEqual(getClientIP(request), '203.0.113.5')
+
+        # `X-Forwarded-For` of an untrusted peer is ignored
+        request = factory.get('/', REMOTE_ADDR='203.0.113.5', HTTP_X_FORWARDED_FOR='198.51.100.1')
+        self.assertEqual(getClientIP(request), '203.0.113.5')
+
+
+class LogsTests(APITestCase):
+    def testLogWriterBatchesRecords(self):
+        records = queue.Queue()
+        writer = logs.LogWriter(records)
+        writer.log_file = logs.HourlyLogFile(directory=tempfile.mkdtemp())
+        queue_handler = QueueHandler(records)
+        with mock.patch.object(logs.logger, 'handlers', [queue_handler]):
+            with mock.patch.object(logs.handler, 'handle'):
+                for i in range(3):
+                    logs.logger.error(f'Error #{i}', extra={'details': 'details', 'send_telegram_message': True})
+
+                with (
+                    mock.patch.object(project_settings, 'TELEGRAM_LOGS_BOT_USERS', [1, 2]),
+                    mock.patch.object(TelegramAPI, 'sendRequest', return_value={'code': 200, 'text': 'OK'}) as send_request
+                ):
+                    writer.start()
+                    writer.stop()
+
+        log_text = readLogFiles(writer.log_file.directory)
+        self.assertEqual([log_text.count(f'Error #{i}') for i in range(3)], [1, 1, 1])
+
+        # The first alert is sent at once, its repeats are sent as one summary
+        self.assertEqual(send_request.call_count, 2 * 2)
+        summary_text = send_request.call_args.kwargs['parameters']['text']
+        self.assertIn('Same error x 2 in the last 60s', summary_text)
+        self.assertIn('Error #2', summary_text)
+
+    def testAlertFingerprint(self):
+        def getRecord(message: str) -> logging.LogRecord:
+            return logging.LogRecord('custom_logger', logging.ERROR, __file__, 0, message, None, None)
+
+        def getTraceback(line: int, exception: str) -> str:
+            return (
+                'Traceback (most recent call last):\n'
+                f'  File "/app/apps/store/views.py", line {line}, in get\n'
+                '    order = Order.objects.get(id=order_id)\n'
+                f'{exception}\n'
+            )
+
+        fingerprint = logs.getAlertFingerprint(getRecord(getTraceback(10, 'OperationalError: connection #1 lost')))
+        self.assertEqual(
+            fingerprint, logs.getAlertFingerprint(getRecord(getTraceback(10, 'OperationalError: connection #2 lost')))
+        )
+        self.assertNotEqual(
+            fingerprint, logs.getAlertFingerprint(getRecord(getTraceback(12, 'OperationalError: connection #1 lost')))
+        )
+        self.assertNotEqual(
+            fingerprint, logs.getAlertFingerprint(getRecord(getTraceback(10, 'DoesNotExist: no order')))
+        )
+
+    def testLogLevels(self):
+        self.assertEqual(logs.getLogLevel('error'), logging.ERROR)
+        self.assertEqual(logs.getLogLevel('Info'), logging.INFO)
+        # A mistyped level doesn't break the caller
+        self.assertEqual(logs.getLogLevel('eror'), logging.WARNING)
+
+    def testRequestLog(self):
+        category = Category.objects.create(title='Stairs', slug='stairs')
+        url = reverse('category_detail', kwargs={'category_slug': category.slug})
+
+        # The text logs get no request records
+        with mock.patch.object(logs, 'addRequestLog') as add_request_log:
+            response = self.client.get(url, HTTP_X_REQUEST_ID='request-1')
+        self.assertEqual(response['X-Request-ID'], 'request-1')
+        add_request_log.assert_not_called()
+
+        with (
+            mock.patch.object(logs, 'addRequestLog') as add_request_log,
+            mock.patch.object(project_settings, 'LOGS_FORMAT', 'json')
+        ):
+            response = self.client.get(url, HTTP_X_REQUEST_ID='request-1')
+        self.assertEqual(response['X-Request-ID'], 'request-1')
+
+        request_fields = add_request_log.call_args.kwargs['request_fields']
+        self.assertEqual(request_fields['request_id'], 'request-1')
+        self.assertEqual(request_fields['route'], 'category_detail')
+        self.assertEqual(request_fields['status'], 200)
+        self.assertGreater(request_fields['db_queries'], 0)
+
+        # The record is written as a JSON line
+        records = queue.Queue()
+        writer = logs.LogWriter(records)
+        writer.log_file = logs.HourlyLogFile(directory=tempfile.mkdtemp())
+        logs.startLogPipeline()
+        with (
+            mock.patch.object(logs.logger, 'handlers', [QueueHandler(records)]),
+            mock.patch.object(logs.handler, 'handle'),
+            mock.patch.object(project_settings, 'LOGS_FORMAT', 'json')
+        ):
+            logs.addRequestLog(**add_request_log.call_args.kwargs)
+            writer.start()
+            writer.stop()
+
+        log = json.loads(readLogFiles(writer.log_file.directory))
+        self.assertEqual(log['level'], 'info')
+        self.assertEqual(log['request_id'], 'request-1')
+        self.assertEqual(log['route'], 'category_detail')
+
+
+class RenderersTests(APITestCase):
+    def testFastJSONRendererOutput(self):
+        data = makeResponseData(
+            status=200,
+            message='Готово\u2028',
+            details={
+                'id': uuid.uuid4(),
+                'price': Decimal('1250.50'),
+                'created_at': datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+                'deadline': date(2025, 3, 10),
+                'images': {'store/images/1.webp'},
+                1: [None, True, 2 ** 70],
+            }
+        )
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+
+        # Floats of a free-form configuration are written by `JSONRenderer`
+        data = {'variants': [{'configuration': {'size': 1e16, 'weight': 2.5, 'ratio': 1e-7}}]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render({'configuration': {'size': float('nan')}})
+
+        body = JSONRenderer().render({'items': [{'id': 1, 'quantity': 2}], 'name': 'Иван'})
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
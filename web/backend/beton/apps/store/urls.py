@@ -9,11 +9,18 @@ urlpatterns = [
     path('products/', views.ProductList.as_view(), name='product_list'),
     path('products/<str:product_slug>/', views.ProductDetail.as_view(), name='product_detail'),
     path('products/<str:product_slug>/variants/', views.ProductVariantList.as_view(), name='product_variant_list'),
+    path(
+        'products/<str:product_slug>/document/', 
+        views.ProductDocumentDetail.as_view(), 
+        name='product_document_detail'
+    ),
     path(
         'products/<str:product_slug>/<str:variant_slug>/', 
         views.ProductVariantDetail.as_view(), 
         name='product_variant_detail'
     ),
     path('orders/', views.OrderList.as_view(), name='order_list'),
+    path('orders/summary/', views.OrderSummaryList.as_view(), name='order_summary_list'),
+    path('orders/changes/', views.OrderChangeList.as_view(), name='order_change_list'),
     path('orders/<str:order_id>/', views.OrderDetail.as_view(), name='order_detail'),
 ]
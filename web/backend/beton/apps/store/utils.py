@@ -1,7 +1,8 @@
 from django.db import models
 
+import os
 import typing
-import uuid
+import hashlib
 from decimal import Decimal
 
 
@@ -9,19 +10,36 @@ Category = typing.NewType('Category', models.Model)
 ProductVariantImage = typing.NewType('ProductVariantImage', models.Model)
 
 
+def getImageExtension(filename: str) -> str:
+    return os.path.splitext(filename)[1].lower()
+
+
+def getImageHash(image) -> str:
+    "SHA-256 of the uploaded image content."
+
+    image_hash = hashlib.sha256()
+    for chunk in image.chunks():
+        image_hash.update(chunk)
+    image.seek(0)
+    return image_hash.hexdigest()
+
+def getContentAddressedLocation(directory: str, content_hash: str, filename: str) -> str:
+    "The images are stored by their content hash, so the same upload gets the same path."
+
+    return f'store/images/{directory}/{content_hash[:2]}/{content_hash}{getImageExtension(filename)}'
+
 def getCategoryImageLocation(instance: Category, filename: str) -> str:
-    image_location = f'store/categories/{instance.slug}.webp'
-    return image_location
+    "The uploaded image keeps its extension until it is converted to WEBP by the `processimages` worker."
+
+    return getContentAddressedLocation('categories', instance.image_hash, filename)
     
 def getProductVariantImageLocation(instance: ProductVariantImage, filename: str) -> str:
-    image_id = uuid.uuid4()
-    image_location = (
-        'store/products/'
-        f'{instance.product_variant.base_product.slug}/'
-        f'{instance.product_variant.slug}/'
-        f'{image_id}.webp'
-    )
-    return image_location
+    return getContentAddressedLocation('products', instance.content_hash, filename)
+
+def getImageRenditionLocation(image_name: str, width: int) -> str:
+    "The renditions are stored next to the image: `{image}-{width}w.webp`."
+
+    return f'{os.path.splitext(image_name)[0]}-{width}w.webp'
 
 def formatPrice(price: Decimal) -> str:
     "Formats the price by adding spaces between thousands and the ruble symbol."
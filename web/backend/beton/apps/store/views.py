@@ -4,7 +4,9 @@ from rest_framework.response import Response
 from rest_framework import status
 
 from django.http import Http404
+from django.utils import timezone
 from django.db import transaction
+from django.db.models import QuerySet, Case, When, F
 
 from utils import makeResponseData, makeModelFilterKwargs
 
@@ -14,16 +16,37 @@ from apps.store.serializers import (
     CategorySerializer, 
     ProductSerializer, 
     ProductVariantSerializer, 
-    OrderSerializer
+    ProductVariantListSerializer, 
+    OrderSerializer, 
+    ProjectionError
 )
-from apps.store.schemas import ProductListOffsetScheme
+from apps.store.schemas import (
+    ProductListOffsetScheme, 
+    ProductListCursorScheme, 
+    OrderListCursorScheme, 
+    OrderCartScheme
+)
+from apps.store.pagination import CursorPaginator, PaginationError
+from apps.store.caching import cacheResponse, conditionalResponse, invalidateNamespaces
+from apps.store.documents import getProductDocument, scheduleProductDocumentsRebuild
+from apps.store.changes import getOrderChanges
 
 import json
 import uuid
+import redis
 from pydantic import ValidationError
 
 
+# Categories and products may be reused for a minute,
+# variants (which carry the stock) and orders are revalidated on every request
+CATALOG_CACHE_CONTROL = 'public, max-age=60'
+VARIANTS_CACHE_CONTROL = 'public, no-cache'
+ORDERS_CACHE_CONTROL = 'private, no-cache'
+
+
 class CategoryList(APIView):
+    @conditionalResponse(namespaces=('category',), cache_control=CATALOG_CACHE_CONTROL)
+    @cacheResponse(namespaces=('category',))
     def get(self, request: Request) -> Response:
         categories = Category.objects.all()
         serialized_categories = CategorySerializer(categories, many=True).data
@@ -54,6 +77,7 @@ class CategoryDetail(APIView):
         except Category.DoesNotExist:
             raise Http404
 
+    @conditionalResponse(namespaces=('category',), cache_control=CATALOG_CACHE_CONTROL)
     def get(self, request: Request, category_slug: str) -> Response:
         category = self.getObject(category_slug)
         serialized_category = CategorySerializer(category).data
@@ -86,36 +110,67 @@ class CategoryDetail(APIView):
 
 
 class ProductList(APIView):
+    paginator = CursorPaginator(
+        ordering=('id',), 
+        cursor_scheme=ProductListCursorScheme, 
+        default_page_size=5
+    )
+
+    @conditionalResponse(namespaces=('category', 'product'), cache_control=CATALOG_CACHE_CONTROL)
+    @cacheResponse(namespaces=('category', 'product'))
     def get(self, request: Request) -> Response:
-        offset = request.GET.get('offset')
-        if offset:
-            try:
-                offset = json.loads(offset)
-                offset = ProductListOffsetScheme(**offset)
-            except (TypeError, json.decoder.JSONDecodeError):
-                response_data = {
-                    'errors': [makeResponseData(status=400, message='Offset must be a valid JSON string')]
-                }
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
-            except ValidationError as e:
-                response_data = {
-                    'errors': [makeResponseData(status=400, message='Offset validation error', details=e.errors())]
-                }
-                return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            offset = ProductListOffsetScheme(start=0, end=5)
-        
         filters = ['category__slug']
         query_params = request.query_params
         filter_kwargs = makeModelFilterKwargs(filters, query_params)
-        if filter_kwargs:
-            products_count = Product.objects.filter(**filter_kwargs).count()
-            products = Product.objects.filter(**filter_kwargs)[offset.start:offset.end]
-        else:
-            products_count = Product.objects.all().count()
-            products = Product.objects.all()[offset.start:offset.end]
+        products = Product.objects.filter(**filter_kwargs)
+
+        try:
+            fields = ProductSerializer.getRequestedFields(query_params)
+        except ProjectionError as e:
+            response_data = {'errors': [makeResponseData(status=400, message=str(e))]}
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+        if fields is not None:
+            products = products.only(*ProductSerializer.getColumns(fields), *self.paginator.fields)
+
+        # Offset pagination is kept for compatibility
+        if 'offset' in query_params:
+            return self.getOffsetPage(products, query_params['offset'], fields)
+
+        try:
+            products_page, next_cursor = self.paginator.paginate(products, query_params)
+            products_count = self.paginator.getCount(products, query_params)
+        except PaginationError as e:
+            response_data = {'errors': [makeResponseData(status=400, message=str(e))]}
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        serialized_products = ProductSerializer(products_page, many=True, fields=fields).data
+
+        details = {'products': serialized_products, 'next_cursor': next_cursor}
+        if products_count is not None:
+            details['products_count'] = products_count
+
+        response_data = makeResponseData(status=200, message='OK', details=details)
+        return Response(response_data, status=status.HTTP_200_OK)
+
+    def getOffsetPage(self, products: QuerySet, offset: str, fields: list[str] | None = None) -> Response:
+        try:
+            offset = json.loads(offset)
+            offset = ProductListOffsetScheme(**offset)
+        except (TypeError, json.decoder.JSONDecodeError):
+            response_data = {
+                'errors': [makeResponseData(status=400, message='Offset must be a valid JSON string')]
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            response_data = {
+                'errors': [makeResponseData(status=400, message='Offset validation error', details=e.errors())]
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
 
-        serialized_products = ProductSerializer(products, many=True).data
+        products_count = products.count()
+        products = products.order_by('id')[offset.start:offset.end]
+
+        serialized_products = ProductSerializer(products, many=True, fields=fields).data
 
         response_data = makeResponseData(
             status=200,
@@ -148,6 +203,8 @@ class ProductDetail(APIView):
         except Product.DoesNotExist:
             raise Http404
 
+    @conditionalResponse(namespaces=('product',), cache_control=CATALOG_CACHE_CONTROL)
+    @cacheResponse(namespaces=('product',))
     def get(self, request: Request, product_slug: str) -> Response:
         product = self.getObject(product_slug)
         serialized_product = ProductSerializer(product).data
@@ -180,25 +237,32 @@ class ProductDetail(APIView):
 
 
 
-class ProductVariantList(APIView):
+class ProductDocumentDetail(APIView):
+    @conditionalResponse(
+        namespaces=('category', 'product', 'variant', 'variant_image', 'product_document'), 
+        cache_control=VARIANTS_CACHE_CONTROL
+    )
     def get(self, request: Request, product_slug: str) -> Response:
-        variants = (
-            ProductVariant.objects
-            .prefetch_related('images')
-            .filter(base_product__slug=product_slug)
-        )
+        product_document = getProductDocument(product_slug)
+        if product_document is None:
+            raise Http404
 
-        serialized_variants = ProductVariantSerializer(variants, many=True).data
+        response_data = makeResponseData(
+            status=200,
+            message='OK',
+            details={'product': product_document}
+        )
+        return Response(response_data, status=status.HTTP_200_OK)
 
-        variant_images = {}
-        for variant in variants:
-            variant_images[variant.id] = set()
-            for image in variant.images.all():
-                variant_images[variant.id].add(str(image.image))
 
-        for i, variant in enumerate(serialized_variants):
-            variant_id = variant['id']
-            serialized_variants[i]['images'] = variant_images[variant_id]
+class ProductVariantList(APIView):
+    @conditionalResponse(namespaces=('product', 'variant', 'variant_image'), cache_control=VARIANTS_CACHE_CONTROL)
+    @cacheResponse(namespaces=('product', 'variant', 'variant_image'))
+    def get(self, request: Request, product_slug: str) -> Response:
+        variants = ProductVariantListSerializer.setupEagerLoading(
+            ProductVariant.objects.filter(base_product__slug=product_slug).order_by('id')
+        )
+        serialized_variants = ProductVariantListSerializer(variants, many=True).data
 
         response_data = makeResponseData(
             status=200,
@@ -223,12 +287,13 @@ class ProductVariantList(APIView):
                 variant = serializer.save()
 
             images = request.FILES.getlist('images')
-            variant_images = []
+            variant_images = {}
             for image in images:
-                variant_images.append(
-                    ProductVariantImage(product_variant=variant, image=image)
-                )
-            ProductVariantImage.objects.bulk_create(variant_images)
+                variant_image = ProductVariantImage(product_variant=variant, image=image)
+                variant_image.deduplicateImage()
+                # The same file uploaded twice is attached once
+                variant_images.setdefault(variant_image.content_hash, variant_image)
+            ProductVariantImage.objects.bulk_create(variant_images.values())
 
             response_data = makeResponseData(
                 status=201,
@@ -245,6 +310,7 @@ class ProductVariantDetail(APIView):
         except ProductVariant.DoesNotExist:
             raise Http404
 
+    @conditionalResponse(namespaces=('product', 'variant'), cache_control=VARIANTS_CACHE_CONTROL)
     def get(self, request: Request, product_slug: str, variant_slug: str) -> Response:
         variant = self.getObject(product_slug, variant_slug)
         serialized_variant = ProductVariantSerializer(variant).data
@@ -276,42 +342,131 @@ class ProductVariantDetail(APIView):
         return Response(response_data, status=status.HTTP_204_NO_CONTENT)
 
 
+def getOrdersPageResponse(request: Request, paginator: CursorPaginator, fields: list[str] | None) -> Response:
+    """
+    Returns the page of the filtered orders with the requested fields (all for `None`).
+    Only the columns of the fields are selected, the items are loaded only if requested.
+    """
+
+    orders = Order.objects.all()
+
+    filters = ['contact', 'contact_method', 'status']
+    query_params = request.query_params
+    filter_kwargs = makeModelFilterKwargs(filters, query_params)
+    if filter_kwargs:
+        orders = orders.filter(**filter_kwargs)
+
+    orders_page_query = orders
+    if fields is not None:
+        orders_page_query = orders_page_query.only(*OrderSerializer.getColumns(fields), *paginator.fields)
+    if fields is None or 'items' in fields:
+        orders_page_query = OrderSerializer.setupEagerLoading(orders_page_query)
+
+    try:
+        orders_page, next_cursor = paginator.paginate(orders_page_query, query_params)
+        orders_count = paginator.getCount(orders, query_params)
+    except PaginationError as e:
+        response_data = {'errors': [makeResponseData(status=400, message=str(e))]}
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+    serialized_orders = OrderSerializer(orders_page, many=True, fields=fields).data
+
+    details = {'orders': serialized_orders, 'next_cursor': next_cursor}
+    if orders_count is not None:
+        details['orders_count'] = orders_count
+
+    response_data = makeResponseData(status=200, message='OK', details=details)
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
 class OrderList(APIView):
+    paginator = CursorPaginator(ordering=('-created_at', '-id'), cursor_scheme=OrderListCursorScheme)
+
+    @conditionalResponse(namespaces=('order', 'product', 'variant'), cache_control=ORDERS_CACHE_CONTROL)
     def get(self, request: Request) -> Response:
-        orders = Order.objects.all()
+        try:
+            fields = OrderSerializer.getRequestedFields(request.query_params)
+        except ProjectionError as e:
+            response_data = {'errors': [makeResponseData(status=400, message=str(e))]}
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
 
-        filters = ['contact', 'contact_method', 'status']
-        query_params = request.query_params
-        filter_kwargs = makeModelFilterKwargs(filters, query_params)
-        if filter_kwargs:
-            orders = orders.filter(**filter_kwargs)
-
-        serialized_orders = OrderSerializer(orders, many=True).data
-        response_data = makeResponseData(
-            status=200,
-            message='OK',
-            details={'orders': serialized_orders}
-        )
-        return Response(response_data, status=status.HTTP_200_OK)
+        return getOrdersPageResponse(request, self.paginator, fields)
 
     def post(self, request: Request) -> Response:
         data = request.data
+        if not isinstance(data, dict):
+            response_data = {'errors': [makeResponseData(status=400, message='Request body must be an object')]}
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            cart = OrderCartScheme(items=data.get('items'))
+        except ValidationError as e:
+            response_data = {
+                'errors': [makeResponseData(status=400, message='Items validation error', details=e.errors())]
+            }
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        # Quantities of the same variant are merged
+        cart_quantities = {}
+        for item in cart.items:
+            cart_quantities[item.id] = cart_quantities.get(item.id, 0) + item.quantity
 
         with transaction.atomic():
             serializer = OrderSerializer(data=data)
-            if serializer.is_valid(raise_exception=True):
-                order = serializer.save()
-
-            order_items = []
-            for item_data in data['items']:
-                try:
-                    product = ProductVariant.objects.get(id=item_data['id'])
-                    order_items.append(
-                        OrderItem(order=order, product=product, quantity=item_data['quantity'])
-                    )
-                except ProductVariant.DoesNotExist:
-                    continue
-            OrderItem.objects.bulk_create(order_items)
+            serializer.is_valid(raise_exception=True)
+
+            # Rows are locked in a stable order, so concurrent orders can't deadlock
+            variants = (
+                ProductVariant.objects
+                .select_for_update()
+                .filter(id__in=cart_quantities)
+                .order_by('id')
+            )
+            variants = {variant.id: variant for variant in variants}
+
+            unknown_variants_ids = [variant_id for variant_id in cart_quantities if variant_id not in variants]
+            if unknown_variants_ids:
+                response_data = {
+                    'errors': [makeResponseData(
+                        status=400, 
+                        message='Product variants not found', 
+                        details={'ids': unknown_variants_ids}
+                    )]
+                }
+                return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+            oversold_items = [
+                {'id': variant_id, 'quantity': quantity, 'stock': variants[variant_id].stock}
+                for variant_id, quantity in cart_quantities.items()
+                if quantity > variants[variant_id].stock
+            ]
+            if oversold_items:
+                response_data = {
+                    'errors': [makeResponseData(
+                        status=409, 
+                        message='Not enough products in stock', 
+                        details={'items': oversold_items}
+                    )]
+                }
+                return Response(response_data, status=status.HTTP_409_CONFLICT)
+
+            order = serializer.save()
+
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=variants[variant_id], quantity=quantity)
+                for variant_id, quantity in cart_quantities.items()
+            ])
+
+            ProductVariant.objects.filter(id__in=cart_quantities).update(
+                updated_at=timezone.now(),
+                stock=Case(*[
+                    When(id=variant_id, then=F('stock') - quantity)
+                    for variant_id, quantity in cart_quantities.items()
+                ])
+            )
+            # The bulk update doesn't send signals
+            invalidateNamespaces('variant')
+            scheduleProductDocumentsRebuild([variant.base_product_id for variant in variants.values()])
 
             response_data = makeResponseData(
                 status=201,
@@ -321,14 +476,50 @@ class OrderList(APIView):
             return Response(response_data, status=status.HTTP_201_CREATED)
 
 
+class OrderSummaryList(APIView):
+    "Orders list in the `summary` view of `OrderList` for browsing the orders page by page."
+
+    paginator = OrderList.paginator
+
+    @conditionalResponse(namespaces=('order',), cache_control=ORDERS_CACHE_CONTROL)
+    def get(self, request: Request) -> Response:
+        return getOrdersPageResponse(request, self.paginator, OrderSerializer.views['summary'])
+
+
+class OrderChangeList(APIView):
+    "Ids of the orders changed after the `since` version, polled by the bot to invalidate its cache."
+
+    @checkAuthToken
+    def get(self, request: Request) -> Response:
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                response_data = {'errors': [makeResponseData(status=400, message='Since must be an integer')]}
+                return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            changes = getOrderChanges(since)
+        except redis.RedisError:
+            response_data = {'errors': [makeResponseData(status=503, message='Change feed is unavailable')]}
+            return Response(response_data, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        response_data = makeResponseData(status=200, message='OK', details=changes)
+        response = Response(response_data, status=status.HTTP_200_OK)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
 class OrderDetail(APIView):
     def getObject(self, order_id: str) -> Order:
         try:
             order_id = uuid.UUID(order_id).hex
-            return Order.objects.get(id=order_id)
+            return OrderSerializer.setupEagerLoading(Order.objects.all()).get(id=order_id)
         except Order.DoesNotExist:
             raise Http404
 
+    @conditionalResponse(namespaces=('order', 'product', 'variant'), cache_control=ORDERS_CACHE_CONTROL)
     def get(self, request: Request, order_id: str) -> Response:
         order = self.getObject(order_id)
         serialized_order = OrderSerializer(order).data
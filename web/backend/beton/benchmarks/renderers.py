@@ -0,0 +1,91 @@
+"""
+Compares the DRF `JSONRenderer` with `FastJSONRenderer` on large order lists.
+
+Run from the `web/backend/beton` directory:
+    python -m benchmarks.renderers --orders 1000 --repeat 20
+"""
+
+import os
+import sys
+import uuid
+import timeit
+import argparse
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+sys.path.append('../')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'beton.settings')
+
+import django
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+
+from utils import makeResponseData
+from beton.renderers import FastJSONRenderer
+
+
+def makeOrdersList(orders_count: int, items_count: int) -> dict:
+    "Builds an order list response shaped like the `OrderList` one."
+
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    orders = []
+    for i in range(orders_count):
+        items = []
+        for j in range(items_count):
+            items.append({
+                'id': i * items_count + j,
+                'product': {
+                    'id': j,
+                    'slug': f'concrete-vase-{j}',
+                    'base_product': {
+                        'id': j,
+                        'slug': f'vases-{j}',
+                        'title': f'Бетонные вазы {j}',
+                        'description': 'Ваза ручной работы из архитектурного бетона',
+                        'category': 1,
+                    },
+                    'title': f'Бетонная ваза {j}',
+                    'configuration': {'color': 'graphite', 'size': 'L'},
+                    'price': Decimal('1250.50') + j,
+                    'stock': 10,
+                },
+                'quantity': j + 1,
+            })
+
+        orders.append({
+            'id': uuid.uuid4(),
+            'items': items,
+            'fullname': 'Иван Петров',
+            'contact': '+79990000000',
+            'contact_method': 'telegram',
+            'status': 'active',
+            'deadline': None,
+            'updated_at': created_at + timedelta(minutes=i),
+            'created_at': created_at + timedelta(minutes=i),
+        })
+
+    return makeResponseData(status=200, message='OK', details={'orders': orders, 'next_cursor': None})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    data = makeOrdersList(args.orders, args.items)
+    renderers = {'JSONRenderer': JSONRenderer(), 'FastJSONRenderer': FastJSONRenderer()}
+
+    outputs = {name: renderer.render(data) for name, renderer in renderers.items()}
+    print(f"Identical output: {outputs['JSONRenderer'] == outputs['FastJSONRenderer']}")
+    print(f"Response size: {len(outputs['JSONRenderer']) / 1024:.1f} KiB ({args.orders} orders)")
+
+    for name, renderer in renderers.items():
+        seconds = min(timeit.repeat(lambda: renderer.render(data), number=1, repeat=args.repeat))
+        print(f"{name}: {seconds * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,91 @@
 from django.conf import settings
 from django.http import JsonResponse
+from django.urls import resolve, Resolver404
+from django.db import connection
 
 import logs
-from utils import makeResponseData, getClientIP, getCurrentDateTime
-from cache import Cache
+from config import project_settings
+from cache import setCommandTimingHook
+from utils import makeResponseData, getClientIP
 
-import json
+from beton.ratelimit import RateLimitPolicies
+
+import re
+import time
+import uuid
 import traceback
-from datetime import datetime
+
+
+REQUEST_ID_PATTERN = re.compile(r'[\w.-]{1,64}')
+
+
+class RequestLogMiddleware:
+    """
+    Assigns an id to the request and, with the `json` logs format, adds one log record per request
+    with its route, status, database and Redis timings and total latency.
+    """
+
+    def __init__(self, next):
+        self.next = next
+        setCommandTimingHook(self.timeRedisCommand)
+
+    def __call__(self, request):
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+
+        # The text logs are kept for the errors, the request records are written only as JSON lines
+        log_request = project_settings.LOGS_FORMAT == 'json'
+
+        context = {'request_id': request_id, 'timed': log_request}
+        context_token = logs.request_context.set(context)
+        started_at = time.perf_counter()
+        try:
+            if log_request:
+                with connection.execute_wrapper(self.timeQuery):
+                    response = self.next(request)
+            else:
+                response = self.next(request)
+        finally:
+            logs.request_context.reset(context_token)
+
+        response['X-Request-ID'] = request_id
+        if not log_request:
+            return response
+
+        duration = time.perf_counter() - started_at
+        resolver_match = getattr(request, 'resolver_match', None)
+        request_fields = {
+            'request_id': request_id,
+            'method': request.method,
+            'path': request.path,
+            'route': resolver_match.url_name if resolver_match else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': context.get('db_count', 0),
+            'db_time_ms': round(context.get('db_time', 0) * 1000, 2),
+            'redis_commands': context.get('redis_count', 0),
+            'redis_time_ms': round(context.get('redis_time', 0) * 1000, 2),
+        }
+        logs.addRequestLog(
+            level='info',
+            message=(
+                f"{request.method} {request.path} {response.status_code} "
+                f"{request_fields['duration_ms']}ms (request {request_id})"
+            ),
+            request_fields=request_fields
+        )
+        return response
+
+    def timeQuery(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            logs.addRequestTiming('db', time.perf_counter() - started_at, count=1)
+
+    def timeRedisCommand(self, seconds: float, count: int) -> None:
+        logs.addRequestTiming('redis', seconds, count)
 
 
 class ExceptionMiddleware:
@@ -38,10 +116,11 @@ class ExceptionMiddleware:
 
 
 class RateLimitMiddleware:
-    """Limits the number of requests per minute from one ip address."""
+    """Limits the number of requests from one ip address by the route policies."""
 
     def __init__(self, next):
         self.next = next
+        self.rate_limit_policies = RateLimitPolicies(settings.RATE_LIMIT)
 
     def __call__(self, request):
         response = self.process_request(request)
@@ -50,55 +129,20 @@ class RateLimitMiddleware:
         return response
 
     def process_request(self, request) -> None | JsonResponse:
-        now = getCurrentDateTime(exclude_timezone=True)
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            url_name = None
+
         client_ip: str = getClientIP(request)
-        reject_request = False
-
-        cache = Cache()
-        client_cache_key = f'requests:{client_ip}'
-        client_requests = cache.getValue(client_cache_key)
-        client_cache_key_ttl = cache.getKeyTTL(client_cache_key)
-
-        if client_requests:
-            client_requests = json.loads(client_requests)
-            client_requests_count = client_requests['count']
-            client_last_request = datetime.strptime(
-                client_requests['last_request'],
-                '%Y-%m-%d %H:%M:%S.%f'
-            )
-
-            # Selecting the delay time depending on the number of requests
-            delay_levels = {
-                1: {'range': range(0, 50), 'delay': 0},
-                2: {'range': range(50, 100), 'delay': 0.25},
-                3: {'range': range(100, 200), 'delay': 0.5},
-            }
-            for level in delay_levels.values():
-                if client_requests_count in level['range']:
-                    request_delay = (now - client_last_request).seconds
-                    if request_delay < level['delay']:
-                        reject_request = True
-                    break
-            else:
-                reject_request = True
+        decision = self.rate_limit_policies.hit(client_ip, url_name, request.method)
 
-            client_requests_count += 1
-        else:
-            client_requests_count = 1
-            client_cache_key_ttl = 60
-
-        # Set actual client requests state
-        client_requests = json.dumps({
-            'count': client_requests_count, 
-            'last_request': now
-        }, default=str)
-
-        cache.setValue(
-            key=client_cache_key, 
-            value=client_requests, 
-            expire=client_cache_key_ttl
-        )
+        if decision['source'] == 'unavailable':
+            response_data = makeResponseData(status=503, message='Service Unavailable')
+            return JsonResponse(response_data, status=503)
 
-        if reject_request:
+        if not decision['allowed']:
             response_data = makeResponseData(status=429, message='Too Many Requests')
-            return JsonResponse(response_data, status=429)
+            response = JsonResponse(response_data, status=429)
+            response['Retry-After'] = decision['retry_after']
+            return response
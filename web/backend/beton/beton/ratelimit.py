@@ -0,0 +1,382 @@
+from cache import Cache, CircuitBreaker
+
+import math
+import time
+import uuid
+import redis
+import threading
+from collections import OrderedDict
+
+
+# Sliding window log kept in a sorted set of request timestamps (milliseconds).
+#
+# KEYS[1] - requests log key.
+# ARGV[1] - window length in milliseconds.
+# ARGV[2] - unique id of the current request.
+# ARGV[3] - number of hits to record: the current request and the hits allowed locally since the last sync.
+# ARGV[4..] - pairs of delay levels: requests count limit and minimal delay in milliseconds.
+#
+# Returns `{allowed, requests count, retry after (milliseconds)}`.
+SLIDING_WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local window = tonumber(ARGV[1])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+
+-- Selecting the delay time depending on the number of requests
+local delay = nil
+for i = 4, #ARGV, 2 do
+    if count < tonumber(ARGV[i]) then
+        delay = tonumber(ARGV[i + 1])
+        break
+    end
+end
+
+if delay == nil then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return {0, count, math.max(tonumber(oldest[2]) + window - now, 0)}
+end
+
+local allowed = 1
+local retry_after = 0
+if delay > 0 then
+    local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+    if last[2] then
+        local request_delay = now - tonumber(last[2])
+        if request_delay < delay then
+            allowed = 0
+            retry_after = delay - request_delay
+        end
+    end
+end
+
+local hits = tonumber(ARGV[3])
+for i = 1, hits do
+    redis.call('ZADD', KEYS[1], now, ARGV[2] .. ':' .. i)
+end
+redis.call('PEXPIRE', KEYS[1], window)
+return {allowed, count + hits, retry_after}
+"""
+
+
+class SlidingWindowRateLimiter:
+    """
+    Atomic sliding window log limiter with tiered delays.
+
+    Each hit is a single Lua script call, so the check and the update happen
+    in one round trip and concurrent workers can't race on the counter.
+    """
+
+    script = None
+
+    def __init__(self, window: int, delay_levels: list[dict]) -> None:
+        """
+        :param window: window length in seconds.
+        :param delay_levels: ascending list of `{'limit': int, 'delay': float}` levels,
+            a request is allowed if at least `delay` seconds passed since the previous one
+            while there are less than `limit` requests in the window.
+            Requests beyond the last level limit are rejected.
+        """
+
+        self.window = window
+        self.window_ms = int(window * 1000)
+        self.max_limit = max(level['limit'] for level in delay_levels)
+        self.levels_args = []
+        for level in sorted(delay_levels, key=lambda level: level['limit']):
+            self.levels_args += [level['limit'], int(level['delay'] * 1000)]
+
+    @classmethod
+    def getScript(cls):
+        if cls.script is None:
+            cls.script = Cache().registerScript(SLIDING_WINDOW_SCRIPT)
+        return cls.script
+
+    def hit(self, key: str, hits: int = 1) -> dict:
+        """
+        Registers a request and decides whether it is allowed.
+
+        :param hits: number of hits to record, the delay is checked for the last one only.
+
+        Returns `allowed` flag, `count` of requests in the window and `retry_after` seconds.
+        """
+
+        script = self.getScript()
+        allowed, count, retry_after_ms = script(
+            keys=[key],
+            args=[self.window_ms, uuid.uuid4().hex, hits, *self.levels_args]
+        )
+        return {
+            'allowed': bool(allowed),
+            'count': count,
+            'retry_after': math.ceil(retry_after_ms / 1000),
+            'source': 'redis',
+        }
+
+
+# Token bucket kept in a hash with the tokens count and the last refill time (milliseconds).
+#
+# KEYS[1] - bucket key.
+# ARGV[1] - bucket capacity.
+# ARGV[2] - refill rate (tokens per second).
+# ARGV[3] - number of hits to take: the current request and the hits allowed locally since the last sync.
+#
+# Returns `{allowed, tokens used, retry after (milliseconds)}`.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local hits = tonumber(ARGV[3])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * refill_rate / 1000)
+
+-- The hits allowed locally are taken unconditionally
+tokens = math.max(tokens - (hits - 1), 0)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    allowed = 1
+    tokens = tokens - 1
+else
+    retry_after = math.ceil((1 - tokens) * 1000 / refill_rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / refill_rate))
+return {allowed, math.floor(capacity - tokens), retry_after}
+"""
+
+
+class TokenBucketRateLimiter:
+    """
+    Atomic token bucket limiter, allows bursts of `capacity` requests
+    refilled by `refill_rate` requests per second.
+    """
+
+    script = None
+
+    def __init__(self, capacity: int, refill_rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.window = capacity / refill_rate
+        self.max_limit = capacity
+
+    @classmethod
+    def getScript(cls):
+        if cls.script is None:
+            cls.script = Cache().registerScript(TOKEN_BUCKET_SCRIPT)
+        return cls.script
+
+    def hit(self, key: str, hits: int = 1) -> dict:
+        """
+        Takes a token for the request and decides whether it is allowed.
+
+        Returns `allowed` flag, `count` of tokens used and `retry_after` seconds.
+        """
+
+        script = self.getScript()
+        allowed, count, retry_after_ms = script(keys=[key], args=[self.capacity, self.refill_rate, hits])
+        return {
+            'allowed': bool(allowed),
+            'count': count,
+            'retry_after': math.ceil(retry_after_ms / 1000),
+            'source': 'redis',
+        }
+
+
+class LocalRateLimiter:
+    """
+    Approximate in-process pre-filter in front of the Redis limiter.
+
+    While a client is well below the limits, its requests are allowed locally
+    and synced to Redis as one batch every `sync_interval` seconds or `sync_batch_size` hits.
+    Clients close to the limits are checked by Redis on every request.
+
+    Redis calls go through a circuit breaker. While Redis is unavailable
+    the `open` failure policy allows requests up to the hard limit counted locally,
+    the `closed` policy rejects them.
+    """
+
+    def __init__(
+        self,
+        remote_limiter: SlidingWindowRateLimiter | TokenBucketRateLimiter,
+        local_limit: int,
+        sync_interval: float,
+        sync_batch_size: int,
+        max_keys: int,
+        failure_policy: str,
+        circuit_breaker: CircuitBreaker,
+    ) -> None:
+        if failure_policy not in ('open', 'closed'):
+            raise ValueError(f'Unknown rate limit failure policy: {failure_policy}')
+
+        self.remote_limiter = remote_limiter
+        self.local_limit = local_limit
+        self.sync_interval = sync_interval
+        self.sync_batch_size = sync_batch_size
+        self.max_keys = max_keys
+        self.failure_policy = failure_policy
+        self.circuit_breaker = circuit_breaker
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+
+    def getClientState(self, key: str, now: float) -> dict:
+        client = self.clients.get(key)
+        if client is None or now - client['synced_at'] >= self.remote_limiter.window:
+            client = {'count': 0, 'pending': 0, 'synced_at': now, 'synced': False}
+            self.clients[key] = client
+
+        self.clients.move_to_end(key)
+        while len(self.clients) > self.max_keys:
+            self.clients.popitem(last=False)
+        return client
+
+    def hit(self, key: str) -> dict:
+        now = time.monotonic()
+
+        with self.lock:
+            client = self.getClientState(key, now)
+            local_count = client['count'] + client['pending']
+            sync_due = (
+                not client['synced']
+                or now - client['synced_at'] >= self.sync_interval
+                or client['pending'] >= self.sync_batch_size
+            )
+            if not sync_due and local_count < self.local_limit:
+                client['pending'] += 1
+                return {'allowed': True, 'count': local_count + 1, 'retry_after': 0, 'source': 'local'}
+
+            pending_hits = client['pending'] + 1
+            client['pending'] = 0
+
+        try:
+            hits = min(pending_hits, self.remote_limiter.max_limit)
+            decision = self.circuit_breaker.call(self.remote_limiter.hit, key, hits=hits)
+        except redis.RedisError:
+            return self.fallbackHit(key, pending_hits)
+
+        with self.lock:
+            client = self.getClientState(key, now)
+            client.update({'count': decision['count'], 'synced_at': now, 'synced': True})
+        return decision
+
+    def fallbackHit(self, key: str, hits: int) -> dict:
+        "Decides by the local counters only while Redis is unavailable."
+
+        with self.lock:
+            client = self.getClientState(key, time.monotonic())
+            # Keep the unsynced hits to send them once Redis is back
+            client['pending'] += hits
+            local_count = client['count'] + client['pending']
+
+        if self.failure_policy == 'closed':
+            return {'allowed': False, 'count': local_count, 'retry_after': 0, 'source': 'unavailable'}
+
+        allowed = local_count <= self.remote_limiter.max_limit
+        return {'allowed': allowed, 'count': local_count, 'retry_after': 0, 'source': 'fallback'}
+
+
+class RateLimitMetrics:
+    """
+    Counts limiter decisions per policy in-process and flushes them
+    to Redis hashes `rate_limit:metrics:<policy>` once per `flush_interval` seconds.
+    """
+
+    def __init__(self, flush_interval: float, circuit_breaker: CircuitBreaker) -> None:
+        self.flush_interval = flush_interval
+        self.circuit_breaker = circuit_breaker
+        self.counters = {}
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, policy_name: str, decision: dict) -> None:
+        outcome = 'allowed' if decision['allowed'] else 'rejected'
+        counter_key = (policy_name, f"{outcome}_{decision['source']}")
+
+        with self.lock:
+            self.counters[counter_key] = self.counters.get(counter_key, 0) + 1
+            if time.monotonic() - self.flushed_at < self.flush_interval:
+                return
+            counters = self.counters
+            self.counters = {}
+            self.flushed_at = time.monotonic()
+
+        try:
+            self.circuit_breaker.call(self.flush, counters)
+        except redis.RedisError:
+            # Counters are lost rather than delaying the requests
+            pass
+
+    def flush(self, counters: dict) -> None:
+        pipeline = Cache().redis_client.pipeline(transaction=False)
+        for (policy_name, field), value in counters.items():
+            pipeline.hincrby(f'rate_limit:metrics:{policy_name}', field, value)
+        pipeline.execute()
+
+    @staticmethod
+    def getMetrics(policies_names: list[str]) -> dict:
+        "Returns the decisions counters of all the workers."
+
+        pipeline = Cache().redis_client.pipeline(transaction=False)
+        for policy_name in policies_names:
+            pipeline.hgetall(f'rate_limit:metrics:{policy_name}')
+
+        metrics = {}
+        for policy_name, counters in zip(policies_names, pipeline.execute()):
+            metrics[policy_name] = {field.decode('utf-8'): int(value) for field, value in counters.items()}
+        return metrics
+
+
+class RateLimitPolicies:
+    """Declarative rate limit policies matched by url name and http method."""
+
+    def __init__(self, rate_limit: dict) -> None:
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=rate_limit['CIRCUIT_BREAKER']['FAILURE_THRESHOLD'],
+            reset_timeout=rate_limit['CIRCUIT_BREAKER']['RESET_TIMEOUT']
+        )
+        self.metrics = RateLimitMetrics(
+            flush_interval=rate_limit['METRICS_FLUSH_INTERVAL'],
+            circuit_breaker=self.circuit_breaker
+        )
+
+        self.policies = rate_limit['POLICIES']
+        self.default_policy_name = rate_limit['DEFAULT_POLICY']
+        self.limiters = {}
+        for policy_name, policy in self.policies.items():
+            self.limiters[policy_name] = LocalRateLimiter(
+                remote_limiter=self.makeRemoteLimiter(policy),
+                local_limit=policy['LOCAL_LIMIT'],
+                sync_interval=rate_limit['SYNC_INTERVAL'],
+                sync_batch_size=rate_limit['SYNC_BATCH_SIZE'],
+                max_keys=rate_limit['LOCAL_MAX_KEYS'],
+                failure_policy=rate_limit['FAILURE_POLICY'],
+                circuit_breaker=self.circuit_breaker
+            )
+
+    @staticmethod
+    def makeRemoteLimiter(policy: dict) -> SlidingWindowRateLimiter | TokenBucketRateLimiter:
+        match policy['ALGORITHM']:
+            case 'sliding_window':
+                return SlidingWindowRateLimiter(window=policy['WINDOW'], delay_levels=policy['DELAY_LEVELS'])
+            case 'token_bucket':
+                return TokenBucketRateLimiter(capacity=policy['CAPACITY'], refill_rate=policy['REFILL_RATE'])
+        raise ValueError(f"Unknown rate limit algorithm: {policy['ALGORITHM']}")
+
+    def getPolicyName(self, url_name: str | None, method: str) -> str:
+        for policy_name, policy in self.policies.items():
+            if url_name in policy.get('ROUTES', []) and method in policy.get('METHODS', []):
+                return policy_name
+        return self.default_policy_name
+
+    def hit(self, client_ip: str, url_name: str | None, method: str) -> dict:
+        policy_name = self.getPolicyName(url_name, method)
+        decision = self.limiters[policy_name].hit(f'rate_limit:{policy_name}:{client_ip}')
+        self.metrics.record(policy_name, decision)
+        return decision
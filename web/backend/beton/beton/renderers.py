@@ -0,0 +1,94 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+import uuid
+import decimal
+import datetime
+import itertools
+from io import BytesIO
+
+try:
+    import orjson
+except ImportError:  # The DRF renderer and parser are used without orjson
+    orjson = None
+
+
+# Types skipped by the floats check without the `isinstance` calls
+SCALAR_TYPES = frozenset({str, int, bool, type(None), decimal.Decimal, datetime.datetime, datetime.date, uuid.UUID})
+CONTAINER_TYPES = (dict, list, tuple, set, frozenset)
+
+if orjson:
+    # Dates are passed to the DRF encoder to keep its format
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def containsFloat(data) -> bool:
+    "Tells whether the containers of the data hold a float (a free-form JSON field may)."
+
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            items = itertools.chain(value, value.values())
+        elif isinstance(value, CONTAINER_TYPES):
+            items = value
+        else:
+            items = (value,)
+
+        for item in items:
+            if type(item) in SCALAR_TYPES:
+                continue
+            if isinstance(item, float):
+                return True
+            if isinstance(item, CONTAINER_TYPES):
+                stack.append(item)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer on orjson, its output is identical to the DRF `JSONRenderer` one.
+
+    Values orjson doesn't encode natively (Decimal, dates, sets, lazy strings)
+    are converted by the DRF encoder. Indented output, values orjson can't
+    encode (integers beyond 64 bits), floats and missing orjson fall back to `JSONRenderer`.
+    """
+
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # orjson writes `1e16` instead of `1e+16` and NaN as `null` instead of raising
+        if containsFloat(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Like `JSONRenderer`, the line and paragraph separators are escaped for javascript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """JSON parser on orjson, falls back to the DRF `JSONParser` for the bodies orjson rejects."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Other charsets, big integers and the error messages are left to `JSONParser`
+            return super().parse(BytesIO(body), media_type, parser_context)
@@ -40,6 +40,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
     # Internal middleware
+    'beton.middleware.RequestLogMiddleware',
     'beton.middleware.ExceptionMiddleware',
     'beton.middleware.RateLimitMiddleware',
 ]
@@ -51,6 +52,106 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [],
     'UNAUTHENTICATED_USER': None,
     'EXCEPTION_HANDLER': 'beton.exceptions.validationExceptionsHandler',
+    'DEFAULT_RENDERER_CLASSES': [
+        'beton.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'beton.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Requests rate limits per client ip address.
+# A request gets the first policy matching its url name and http method, otherwise the default one.
+#
+# `sliding_window` policy: inside the window a request must wait `delay` seconds after the previous one
+# while there are less than `limit` requests, beyond the last limit requests are rejected.
+# `token_bucket` policy: allows bursts of `CAPACITY` requests refilled by `REFILL_RATE` requests per second.
+#
+# While a client has less than `LOCAL_LIMIT` requests (tokens used), they are allowed in-process
+# and synced to Redis every `SYNC_INTERVAL` seconds or `SYNC_BATCH_SIZE` hits.
+RATE_LIMIT = {
+    'POLICIES': {
+        'catalog_read': {
+            'ROUTES': [
+                'category_list', 'category_detail', 
+                'product_list', 'product_detail', 
+                'product_variant_list', 'product_variant_detail',
+                'product_document_detail',
+            ],
+            'METHODS': ['GET', 'HEAD', 'OPTIONS'],
+            'ALGORITHM': 'token_bucket',
+            'CAPACITY': 300,
+            'REFILL_RATE': 5,
+            'LOCAL_LIMIT': 250,
+        },
+        'order_write': {
+            'ROUTES': ['order_list'],
+            'METHODS': ['POST'],
+            'ALGORITHM': 'sliding_window',
+            'WINDOW': 10 * 60,
+            'DELAY_LEVELS': [
+                {'limit': 10, 'delay': 0},
+                {'limit': 30, 'delay': 5},
+            ],
+            'LOCAL_LIMIT': 0,
+        },
+        'default': {
+            'ALGORITHM': 'sliding_window',
+            'WINDOW': 60,
+            'DELAY_LEVELS': [
+                {'limit': 50, 'delay': 0},
+                {'limit': 100, 'delay': 0.25},
+                {'limit': 200, 'delay': 0.5},
+            ],
+            'LOCAL_LIMIT': 40,
+        },
+    },
+    'DEFAULT_POLICY': 'default',
+
+    'SYNC_INTERVAL': 1,
+    'SYNC_BATCH_SIZE': 10,
+    'LOCAL_MAX_KEYS': 10_000,
+
+    # While Redis is unavailable `open` allows requests up to the last limit counted locally, `closed` rejects them
+    'FAILURE_POLICY': 'open',
+    'CIRCUIT_BREAKER': {
+        'FAILURE_THRESHOLD': 5,
+        'RESET_TIMEOUT': 10,
+    },
+
+    # Limiter decisions counters are flushed to Redis once per interval (seconds)
+    'METRICS_FLUSH_INTERVAL': 10,
+}
+
+# Proxies allowed to set the `X-Forwarded-For` header (addresses or networks)
+TRUSTED_PROXIES = ['127.0.0.1', '::1']
+
+# Verified auth tokens cache (seconds)
+AUTH_TOKEN_CACHE = {
+    'LOCAL_MAX_SIZE': 1024,
+    'LOCAL_EXPIRE': 30,
+    'REDIS_EXPIRE': 300,
+    # A failed start of the invalidations listener is retried after the timeout
+    'LISTENER_RETRY_TIMEOUT': 10,
+}
+
+# Catalog responses cache, entries are invalidated by the bumps of their namespaces versions (seconds)
+CATALOG_CACHE = {
+    'LOCAL_MAX_SIZE': 512,
+    'LOCAL_EXPIRE': 60,
+    'REDIS_EXPIRE': 600,
+    'CIRCUIT_BREAKER': {
+        'FAILURE_THRESHOLD': 5,
+        'RESET_TIMEOUT': 10,
+    },
+}
+
+# Order change feed read by the bot to invalidate its cache, the changes are kept for `RETENTION` seconds
+ORDER_CHANGES = {
+    'RETENTION': 24 * 60 * 60,
 }
 
 TEMPLATES = [
@@ -105,5 +206,14 @@ else:
 MEDIA_URL = 'media/'
 MEDIA_ROOT = 'media'
 
+# The paths of the images stored by their content hash never change their content.
+# The front server serving `MEDIA_ROOT` in production must send
+# `Cache-Control: public, max-age=<MAX_AGE>, immutable` for the media under `PREFIX`
+# (the development media view reads these values).
+IMMUTABLE_MEDIA = {
+    'PREFIX': 'store/images/',
+    'MAX_AGE': 365 * 24 * 60 * 60,
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -1,8 +1,18 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from beton import views
+
+import re
 
 
 urlpatterns = [
     path('store/', include('apps.store.urls'), name='store'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics/rate-limits/', views.RateLimitStatistics.as_view(), name='rate_limit_statistics'),
+]
+
+# Media is served by Django only in development, see `IMMUTABLE_MEDIA` for the front server
+if settings.DEBUG:
+    urlpatterns.append(
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.*)$', views.serveMedia, name='media')
+    )
@@ -0,0 +1,45 @@
+from rest_framework.views import APIView
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework import status
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.views.static import serve
+
+from utils import makeResponseData
+
+from apps.auth.access import checkAuthToken
+from beton.ratelimit import RateLimitMetrics
+
+import redis
+
+
+class RateLimitStatistics(APIView):
+    @checkAuthToken
+    def get(self, request: Request) -> Response:
+        policies_names = list(settings.RATE_LIMIT['POLICIES'])
+        try:
+            metrics = RateLimitMetrics.getMetrics(policies_names)
+        except redis.RedisError:
+            response_data = {'errors': [makeResponseData(status=503, message='Metrics storage is unavailable')]}
+            return Response(response_data, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        response_data = makeResponseData(
+            status=200,
+            message='OK',
+            details={'policies': metrics}
+        )
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+def serveMedia(request: HttpRequest, path: str) -> HttpResponse:
+    """
+    Serves the media files in development, the content-addressed ones are cached by the clients as immutable.
+    `serve` isn't fit for production, where the front server sends the same headers.
+    """
+
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith(settings.IMMUTABLE_MEDIA['PREFIX']):
+        response['Cache-Control'] = f"public, max-age={settings.IMMUTABLE_MEDIA['MAX_AGE']}, immutable"
+    return response
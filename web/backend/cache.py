@@ -1,13 +1,56 @@
 from config import project_settings
 
 import redis
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+# Called with the seconds spent in a Redis command and the number of the sent commands
+command_timing = {'hook': None}
+
+
+def setCommandTimingHook(hook: Callable[[float, int], None] | None) -> None:
+    "Sets the function receiving the timings of the Redis commands, `None` stops the timing."
+
+    command_timing['hook'] = hook
+
+
+class TimedConnection(redis.Connection):
+    """Redis connection, which passes the time of its commands to the timing hook."""
+
+    def send_packed_command(self, command, check_health: bool = True) -> None:
+        hook = command_timing['hook']
+        if hook is None:
+            return super().send_packed_command(command, check_health)
+
+        started_at = time.perf_counter()
+        try:
+            super().send_packed_command(command, check_health)
+        finally:
+            hook(time.perf_counter() - started_at, 1)
+
+    def read_response(self, *args, **kwargs) -> Any:
+        hook = command_timing['hook']
+        if hook is None:
+            return super().read_response(*args, **kwargs)
+
+        started_at = time.perf_counter()
+        try:
+            return super().read_response(*args, **kwargs)
+        finally:
+            hook(time.perf_counter() - started_at, 0)
 
 
 redis_pool = redis.ConnectionPool(
+    connection_class=TimedConnection,
     host=project_settings.CACHE_HOST,
     port=project_settings.CACHE_PORT,
     db=project_settings.CACHE_DB,
     max_connections=project_settings.CACHE_MAX_CONNECTIONS,
+    socket_timeout=project_settings.CACHE_SOCKET_TIMEOUT,
+    socket_connect_timeout=project_settings.CACHE_SOCKET_TIMEOUT,
 )
 
 
@@ -35,3 +78,117 @@ class Cache:
         ttl = self.redis_client.ttl(key)
         if ttl not in [-2, -1]:
             return ttl
+
+    def getSetMembers(self, key: str) -> set[str]:
+        members: set[bytes] = self.redis_client.smembers(key)
+        return {member.decode('utf-8') for member in members}
+
+    def publishMessage(self, channel: str, message: str) -> None:
+        self.redis_client.publish(channel, message)
+
+    def registerScript(self, script: str) -> redis.commands.core.Script:
+        "Registers a Lua script, which is executed by its SHA1 digest in a single round trip."
+
+        return self.redis_client.register_script(script)
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """Raised instead of calling the service while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service after `failure_threshold` consecutive failures.
+
+    After `reset_timeout` seconds a single trial call is let through:
+    its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(
+        self, 
+        failure_threshold: int = 5, 
+        reset_timeout: float = 10, 
+        exceptions: tuple = (redis.RedisError,)
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.exceptions = exceptions
+        self.failures_count = 0
+        self.opened_at = None
+        self.trial_call_running = False
+        self.lock = threading.Lock()
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        with self.lock:
+            if self.opened_at is not None:
+                circuit_ready = time.monotonic() - self.opened_at >= self.reset_timeout
+                if not circuit_ready or self.trial_call_running:
+                    raise CircuitOpenError('Circuit breaker is open')
+                self.trial_call_running = True
+
+        try:
+            result = func(*args, **kwargs)
+        except self.exceptions:
+            with self.lock:
+                self.trial_call_running = False
+                self.failures_count += 1
+                if self.opened_at is not None or self.failures_count >= self.failure_threshold:
+                    self.opened_at = time.monotonic()
+            raise
+
+        with self.lock:
+            self.trial_call_running = False
+            self.failures_count = 0
+            self.opened_at = None
+        return result
+
+
+class LocalCache:
+    """In-process LRU cache with per-entry expiration, shared by the threads of one worker."""
+
+    def __init__(self, max_size: int = 1024, expire: float = MINUTE_SECONDS) -> None:
+        self.max_size = max_size
+        self.expire = expire
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def setValue(self, key: str, value: Any, expire: float = None) -> None:
+        if expire is None:
+            expire = self.expire
+        expires_at = time.monotonic() + expire
+
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def getValue(self, key: str) -> Any | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def deleteKey(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def deleteWhere(self, predicate: Callable[[str, Any], bool]) -> None:
+        "Deletes all the entries for which `predicate(key, value)` is true."
+
+        with self.lock:
+            for key, (value, expires_at) in list(self.entries.items()):
+                if predicate(key, value):
+                    del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
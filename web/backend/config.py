@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 
@@ -18,6 +19,10 @@ class ProjectSettings(BaseSettings):
     CACHE_PORT: str
     CACHE_DB: int
     CACHE_MAX_CONNECTIONS: int
+    CACHE_SOCKET_TIMEOUT: float = 0.5
+
+    # Logs (`text` or `json` lines)
+    LOGS_FORMAT: Literal['text', 'json'] = 'text'
 
     # Telegram Bots
     TELEGRAM_LOGS_BOT_TOKEN: str
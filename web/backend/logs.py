@@ -2,83 +2,402 @@ from config import project_settings
 from api.telegram import TelegramAPI
 
 import os
+import re
+import json
+import time
+import queue
+import atexit
+import hashlib
 import datetime
 import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler
 
 
 # Create a custom formatter
 time_format = "%Y-%m-%d %H:%M:%S"
 formatter = logging.Formatter(fmt='%(asctime)s [%(levelname)s] - %(message)s', datefmt=time_format)
 
-# Create a logger and set the custom formatter
+# Create a logger, its records are handled by the background threads of the log pipeline
 logger = logging.getLogger('custom_logger')
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+
 handler = logging.StreamHandler()
 handler.setFormatter(formatter)
-logger.addHandler(handler)
 
+# Telegram alerts: the first alert of a kind is sent at once, its repeats are aggregated during the window
+ALERTS_AGGREGATION_WINDOW = 60
+ALERTS_PER_MINUTE = 20
+ALERTS_QUEUE_SIZE = 1000
 
-def addLog(level: str, message: str, details: str = None, send_telegram_message: bool = False) -> None:
+# Timings of the request handled by the current thread, see `beton.middleware.RequestLogMiddleware`
+request_context: contextvars.ContextVar[dict | None] = contextvars.ContextVar('request_context', default=None)
+
+
+class HourlyLogFile:
+    """Buffered writer of `logs/<year>/<month>/<day>/log-<hour>.log` files, switching the file once per hour."""
+
+    def __init__(self, directory: str = 'logs') -> None:
+        self.directory = directory
+        self.file = None
+        self.file_hour = None
+
+    def getFile(self, now: datetime.datetime):
+        file_hour = (now.year, now.month, now.day, now.hour)
+        if file_hour != self.file_hour:
+            self.close()
+            path = f"{self.directory}/{now.year}/{now.month}/{now.day}/"
+            os.makedirs(path, exist_ok=True)
+            self.file = open(path + f"log-{now.hour}.log", 'a', encoding='utf-8', buffering=64 * 1024)
+            self.file_hour = file_hour
+        return self.file
+
+    def write(self, now: datetime.datetime, text: str) -> None:
+        self.getFile(now).write(text)
+
+    def flush(self) -> None:
+        if self.file:
+            self.file.flush()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.file_hour = None
+
+
+def getAlertFingerprint(record: logging.LogRecord) -> str:
     """
-    Adds new log to file, console and telegram chat.
+    Returns the fingerprint of an alert, equal for the repeats of the same error.
 
-    :param level: log level (`info`, 'debug', 'warning', 'error', 'critical').
-    :param message: log message.
-    :param send_telegram_message: determines whether a log will be sent to telegram chat.
+    A traceback is identified by its frames and the exception type,
+    other messages by their text with the numbers and addresses masked.
     """
-    
-    # Write the log into the log file
-    now = datetime.datetime.now()
-    path = f"logs/{now.year}/{now.month}/{now.day}/"
-    filename = path + f"log-{now.hour}.log"
-
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(filename, 'a') as file:
-        separator_string = f"\n\n{'='*50}\n\n"
-        log = (
-            "{0} [{1}]\n\n"
-            "Exception message:\n{2}\n"
-            "Exception details:\n{3}" 
-            + separator_string
-        )
+
+    message = str(record.getMessage())
+    if message.startswith('Traceback (most recent call last)'):
+        lines = message.strip().splitlines()
+        frames = [line.strip() for line in lines if line.strip().startswith('File "')]
+        exception_type = lines[-1].split(':', 1)[0]
+        fingerprint_text = '\n'.join(frames + [exception_type])
+    else:
+        fingerprint_text = re.sub(r'0x[0-9a-fA-F]+|\d+', '#', message)
+
+    return hashlib.sha1(f'{record.levelname}\n{fingerprint_text}'.encode('utf-8')).hexdigest()
+
+
+class TelegramAlertsSender(threading.Thread):
+    """
+    Sends log alerts to the Telegram bot users in the background.
+
+    Alerts are put to a bounded queue, the overflow is counted and reported instead of sent.
+    The first alert of a fingerprint is sent at once, the repeats in the next
+    `ALERTS_AGGREGATION_WINDOW` seconds are sent as one summary.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(name='telegram-alerts-sender', daemon=True)
+        self.alerts = queue.Queue(maxsize=ALERTS_QUEUE_SIZE)
+        self.dropped_alerts = 0
+        self.dropped_alerts_lock = threading.Lock()
+        self.aggregated_alerts = {}
+        self.sending_times = []
+
+    def addAlert(self, record: logging.LogRecord) -> None:
         try:
-            file.write(log.format(now, level, message, details))
-        except:
-            message = message.encode('utf-8')
-            details = details.encode('utf-8')
-            file.write(log.format(now, level, message, details))
-
-    # Send the log message to Telegram Bot users
-    if send_telegram_message:
+            self.alerts.put_nowait(record)
+        except queue.Full:
+            with self.dropped_alerts_lock:
+                self.dropped_alerts += 1
+
+    def stop(self) -> None:
+        try:
+            self.alerts.put(None, timeout=1)
+        except queue.Full:
+            pass
+
+    def popDroppedAlerts(self) -> int:
+        with self.dropped_alerts_lock:
+            dropped_alerts, self.dropped_alerts = self.dropped_alerts, 0
+        return dropped_alerts
+
+    def isSendingAllowed(self) -> bool:
+        now = time.monotonic()
+        self.sending_times = [sent_at for sent_at in self.sending_times if now - sent_at < 60]
+        if len(self.sending_times) >= ALERTS_PER_MINUTE:
+            return False
+        self.sending_times.append(now)
+        return True
+
+    def aggregateAlert(self, record: logging.LogRecord) -> None:
+        fingerprint = getAlertFingerprint(record)
+        aggregated_alert = self.aggregated_alerts.get(fingerprint)
+
+        if aggregated_alert:
+            aggregated_alert['record'] = record
+            aggregated_alert['count'] += 1
+            return
+
+        self.aggregated_alerts[fingerprint] = {
+            'record': record,
+            'count': 0,
+            'window_started_at': time.monotonic(),
+        }
+        self.sendAlert(record)
+
+    def sendAggregatedAlerts(self, force: bool = False) -> None:
+        "Sends the summaries of the closed aggregation windows."
+
+        now = time.monotonic()
+        for fingerprint, aggregated_alert in list(self.aggregated_alerts.items()):
+            if not force and now - aggregated_alert['window_started_at'] < ALERTS_AGGREGATION_WINDOW:
+                continue
+
+            del self.aggregated_alerts[fingerprint]
+            if aggregated_alert['count']:
+                self.sendAlert(aggregated_alert['record'], repeats=aggregated_alert['count'])
+
+    def run(self) -> None:
+        running = True
+        while running:
+            try:
+                record = self.alerts.get(timeout=1)
+            except queue.Empty:
+                record = False
+
+            if record is None:
+                running = False
+            elif record:
+                try:
+                    self.aggregateAlert(record)
+                except Exception:
+                    pass
+
+            try:
+                self.sendAggregatedAlerts(force=not running)
+            except Exception:
+                pass
+
+    def sendAlert(self, record: logging.LogRecord, repeats: int = 0) -> None:
+        if not self.isSendingAllowed():
+            with self.dropped_alerts_lock:
+                self.dropped_alerts += max(repeats, 1)
+            return
+
         bot_token: str = project_settings.TELEGRAM_LOGS_BOT_TOKEN
         recepients: list = project_settings.TELEGRAM_LOGS_BOT_USERS
 
         telegram_api = TelegramAPI(bot_token)
 
         disable_notification = True
-        if level.lower() in ['error', 'critical']:
+        if record.levelno >= logging.ERROR:
             disable_notification = False
 
-        for user_id in recepients:
-            response = telegram_api.sendRequest(
-                request_method='POST',
-                api_method='sendMessage',
-                parameters={
-                    'chat_id': user_id,
-                    'message': (
-                        f"*[{level.upper()}]* _({now})_\n\n"
-                        f"*Expection message:*\n`{message}`\n"
-                        f"*Exceptions details:*\n`{details}`"
-                    ),
-                    'parse_mode': 'Markdown',
-                    'disable_notification': disable_notification,
-                }
-            )
-            
-            if response['code'] == 400:
+        now = datetime.datetime.fromtimestamp(record.created)
+        text = f"*[{record.levelname}]* _({now})_\n\n"
+        if repeats:
+            text += f"*Same error x {repeats:,} in the last {ALERTS_AGGREGATION_WINDOW}s*\n\n"
+        dropped_alerts = self.popDroppedAlerts()
+        if dropped_alerts:
+            text += f"*Dropped alerts:* {dropped_alerts:,}\n\n"
+        text += (
+            f"*Expection message:*\n`{record.getMessage()}`\n"
+            f"*Exceptions details:*\n`{record.details}`"
+        )
+
+        responses = telegram_api.sendMessages(
+            chat_ids=recepients,
+            text=text,
+            parse_mode='Markdown',
+            disable_notification=disable_notification,
+        )
+
+        for response in responses:
+            if response['code'] != 200:
                 addLog(
-                    level='error', 
-                    message=(
-                        "Telegram message with last error log didn't send.\n",
-                        f"API response: {response['text']}"
-                    )
+                    level='error',
+                    message="Telegram message with last error log didn't send.",
+                    details=f"API response: {response['text']}"
                 )
+
+
+class LogWriter(threading.Thread):
+    """
+    Background writer of the log records put to the queue by `QueueHandler`.
+
+    Records are taken in batches and written with a single flush,
+    Telegram alerts are passed to `TelegramAlertsSender`.
+    """
+
+    max_batch_size = 500
+
+    def __init__(self, records: queue.Queue) -> None:
+        super().__init__(name='log-writer', daemon=True)
+        self.records = records
+        self.log_file = HourlyLogFile()
+        self.alerts_sender = TelegramAlertsSender()
+
+    def start(self) -> None:
+        self.alerts_sender.start()
+        super().start()
+
+    def stop(self) -> None:
+        self.records.put(None)
+        self.join(timeout=5)
+        self.alerts_sender.stop()
+        self.alerts_sender.join(timeout=5)
+
+    def run(self) -> None:
+        running = True
+        while running:
+            batch = [self.records.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+
+            for record in batch:
+                if record is None:
+                    running = False
+                    continue
+                try:
+                    self.handleRecord(record)
+                except Exception:
+                    pass
+
+            try:
+                self.log_file.flush()
+            except OSError:
+                pass
+
+        self.log_file.close()
+
+    def handleRecord(self, record: logging.LogRecord) -> None:
+        handler.handle(record)
+
+        now = datetime.datetime.fromtimestamp(record.created)
+        request_fields: dict | None = getattr(record, 'request', None)
+
+        if project_settings.LOGS_FORMAT == 'json':
+            log = {
+                'time': now.isoformat(),
+                'level': record.levelname.lower(),
+                'message': str(record.getMessage()),
+                'details': record.details,
+                'request_id': getattr(record, 'request_id', None),
+            }
+            if request_fields:
+                log.update(request_fields)
+            self.log_file.write(now, json.dumps(log, ensure_ascii=False, default=str) + '\n')
+        elif request_fields:
+            self.log_file.write(now, f"{now} [{record.levelname.lower()}] {record.getMessage()}\n")
+        else:
+            separator_string = f"\n\n{'='*50}\n\n"
+            log = (
+                "{0} [{1}]\n\n"
+                "Exception message:\n{2}\n"
+                "Exception details:\n{3}"
+                + separator_string
+            )
+            self.log_file.write(now, log.format(now, record.levelname.lower(), record.getMessage(), record.details))
+
+        if record.send_telegram_message:
+            self.alerts_sender.addAlert(record)
+
+
+log_pipeline = {'writer': None, 'queue_handler': None, 'pid': None}
+log_pipeline_lock = threading.Lock()
+
+
+def startLogPipeline() -> None:
+    "Starts the log writer of the current process, threads don't survive a worker fork."
+
+    if log_pipeline['pid'] == os.getpid():
+        return
+
+    with log_pipeline_lock:
+        if log_pipeline['pid'] == os.getpid():
+            return
+
+        records = queue.Queue()
+        queue_handler = QueueHandler(records)
+        if log_pipeline['queue_handler']:
+            logger.removeHandler(log_pipeline['queue_handler'])
+        logger.addHandler(queue_handler)
+
+        writer = LogWriter(records)
+        writer.start()
+        log_pipeline.update({'writer': writer, 'queue_handler': queue_handler, 'pid': os.getpid()})
+
+
+def stopLogPipeline() -> None:
+    "Writes out the queued records before the process exits."
+
+    if log_pipeline['pid'] == os.getpid():
+        log_pipeline['writer'].stop()
+
+
+atexit.register(stopLogPipeline)
+
+
+def getLogLevel(level: str) -> int:
+    "Returns the logging level of the name, an unknown name is logged as a warning instead of failing."
+
+    level = logging.getLevelName(str(level).upper())
+    return level if isinstance(level, int) else logging.WARNING
+
+
+def getRequestID() -> str | None:
+    context = request_context.get()
+    if context:
+        return context['request_id']
+
+
+def addRequestTiming(metric: str, seconds: float, count: int = 0) -> None:
+    """
+    Adds the time spent by the current request in a backend (`db`, `redis`)
+    to `<metric>_time` and the number of calls to `<metric>_count`.
+    """
+
+    context = request_context.get()
+    if context is not None and context['timed']:
+        context[f'{metric}_time'] = context.get(f'{metric}_time', 0) + seconds
+        context[f'{metric}_count'] = context.get(f'{metric}_count', 0) + count
+
+
+def addLog(level: str, message: str, details: str = None, send_telegram_message: bool = False) -> None:
+    """
+    Adds new log to file, console and telegram chat.
+
+    The record is only put to the queue, the writing and sending happen in background threads.
+
+    :param level: log level (`info`, 'debug', 'warning', 'error', 'critical').
+    :param message: log message.
+    :param send_telegram_message: determines whether a log will be sent to telegram chat.
+    """
+
+    startLogPipeline()
+    logger.log(
+        getLogLevel(level),
+        message,
+        extra={'details': details, 'send_telegram_message': send_telegram_message, 'request_id': getRequestID()}
+    )
+
+
+def addRequestLog(level: str, message: str, request_fields: dict) -> None:
+    "Adds the summary record of a request, its fields are written as is in the `json` logs format."
+
+    startLogPipeline()
+    logger.log(
+        getLogLevel(level),
+        message,
+        extra={
+            'details': None,
+            'send_telegram_message': False,
+            'request_id': request_fields.get('request_id'),
+            'request': request_fields,
+        }
+    )
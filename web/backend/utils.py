@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.http.request import HttpRequest, QueryDict
 from django.utils import timezone as django_timezone
 
+import ipaddress
+import functools
 from typing import Any
 from datetime import datetime
 from zoneinfo import ZoneInfo
@@ -23,12 +26,39 @@ def getCurrentDateTime(timezone_code: str = 'UTC', exclude_timezone: bool = Fals
     return current_datetime
 
 
+@functools.cache
+def getTrustedProxiesNetworks(trusted_proxies: tuple) -> tuple:
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in trusted_proxies)
+
+
+def isTrustedProxy(ip: str) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+
+    networks = getTrustedProxiesNetworks(tuple(settings.TRUSTED_PROXIES))
+    return any(address in network for network in networks)
+
+
 def getClientIP(request: HttpRequest) -> str:
+    """
+    Returns the client ip address.
+
+    `X-Forwarded-For` is used only when the request came from a trusted proxy,
+    the client is the nearest address in the chain which isn't a trusted proxy.
+    """
+
+    ip = request.META.get('REMOTE_ADDR')
+
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
+    if x_forwarded_for and isTrustedProxy(ip):
+        forwarded_ips = [forwarded_ip.strip() for forwarded_ip in x_forwarded_for.split(',')]
+        for forwarded_ip in reversed(forwarded_ips):
+            ip = forwarded_ip
+            if not isTrustedProxy(forwarded_ip):
+                break
+
     return ip
 
 